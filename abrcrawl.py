@@ -38,9 +38,19 @@ __author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
 __license__ = "BSD"
 
 import sys
+import os
 import getopt
 import re
+import time
 import urllib2
+import workerpool
+import scheduler
+import output_writers
+import http_cache
+import checkpoint
+import photo_db
+import stats
+import ptdates
 import csv
 import simplejson as json
 
@@ -48,10 +58,18 @@ import simplejson as json
 AGENCIA_BRASIL_GALLERY_URL = "http://www.agenciabrasil.gov.br/imagens/banco_de_imagens_view/lista"
 AGENCIA_BRASIL_PAGINATION_PARAM = "b_start:int"
 AGENCIA_BRASIL_PAGE_SIZE = 15
-OUTPUT_FORMATS = ['csv','json']
+OUTPUT_FORMATS = output_writers.FORMATS + ['sqlite']
+APPENDABLE_FORMATS = output_writers.APPENDABLE_FORMATS + ['sqlite']
+OUTPUT_KEYS = ['pub_day', 'thumbnail_url', 'photo_page', 'description', 'author']
+DEFAULT_HOST_CONNECTIONS = 4
+DEFAULT_INCREMENTAL_PAGES = 100
+SQLITE_MAGIC = 'SQLite format 3\x00'
+ISO_DAY_PATTERN = re.compile(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}$')
 
 #GLOBAL FLAGS
 verbose = None
+request_scheduler = None
+response_cache = None
 
 # response = urllib2.urlopen("http://www.acme.com/tables.html")
 
@@ -69,22 +87,47 @@ Parameters:
   -p, --pages:\t\tThe number of pages to retrieve (ABr uses %s images per page)
   -f, --format:\t\tThe output format. Available formats: %s
   -i, --indent:\t\tIf output format can be pretty printed(json for example) use the number of white spaces to use as indent level.
-  -o, --output-file:\tSave the output to a given filename.
+  -o, --output-file:\tSave the output to a given filename (required by the sqlite format, crawling again updates the database).
+  -w, --workers:\tThe number of pages to download at the same time (default 1).
+  --host-connections:\tThe maximum number of simultaneous requests to the same host (default %s). The limit starts at 1, grows while the host answers normally and is halved when it is overloaded.
+  --retries:\t\tThe number of times a request is tried again after a timeout or an error like 503 (default %s).
+  --cache-dir:\t\tKeep downloaded pages in this directory and reuse them on later runs.
+  --max-age:\t\tSeconds a cached page is used without asking the server if it changed (default 0).
+  --cache-size:\t\tMaximum size of the cache directory in megabytes (default %s).
+  --offline:\t\tOnly use pages from the cache, never access the network.
+  -r, --resume:\t\tContinue an interrupted crawl, skipping the pages already saved to the --output-file. Pages that failed on the previous run are appended after the later pages, so the file is then no longer in date order; sort it again with merge_crawls.py before using it as sorted input.
+  -s, --since:\t\tThe output of a previous crawl (in any format). Only output the photos that are not in it, stopping at the first page without new photos (at most --pages, default %s).
+  --stats:\t\tSave timings, HTTP status counts, bytes downloaded and cache hit rates to this JSON file.
+  --progress:\t\tPrint a progress line to stderr every N seconds.
   -v, --verbose:\tPrint extra info while performing the tasks.
-""" % (AGENCIA_BRASIL_PAGE_SIZE, ', '.join(OUTPUT_FORMATS))
+""" % (AGENCIA_BRASIL_PAGE_SIZE, ', '.join(OUTPUT_FORMATS), DEFAULT_HOST_CONNECTIONS, scheduler.DEFAULT_RETRIES, http_cache.DEFAULT_MAX_SIZE / (1024 * 1024), DEFAULT_INCREMENTAL_PAGES)
 
 def main():
-  global verbose
+  global verbose, request_scheduler, response_cache
   start_date = None
-  page_total = 1
+  page_total = None
+  since_file_name = None
+  known_pages = None
+  newest_day = None
+  workers = 1
+  host_connections = DEFAULT_HOST_CONNECTIONS
+  retries = scheduler.DEFAULT_RETRIES
+  cache_dir = None
+  cache_max_age = 0
+  cache_size = http_cache.DEFAULT_MAX_SIZE
+  offline = False
   results_format = 'csv'
-  table = []
   output_file = sys.stdout
+  output_file_name = None
+  resume = False
+  journal = None
   indent_level = None
+  stats_file_name = None
+  progress_interval = 0
   if(len(sys.argv) < 2):
     return usage()
   try:
-    opts, args = getopt.getopt(sys.argv[1:], "hd:p:vf:o:i:", ["help", "date=", "pages=", "verbose", "format=", "output-file=", "indent="])
+    opts, args = getopt.getopt(sys.argv[1:], "hd:p:vf:o:i:w:rs:", ["help", "date=", "pages=", "verbose", "format=", "output-file=", "indent=", "workers=", "host-connections=", "retries=", "cache-dir=", "max-age=", "cache-size=", "offline", "resume", "since=", "stats=", "progress="])
   except getopt.GetoptError, err:
     # print help information and exit:
     print str(err) # will print something like "option -a not recognized"
@@ -103,34 +146,159 @@ def main():
     elif o in ("-f", "--format"):
       results_format = a
     elif o in ("-o", "--output-file"):
-      output_file = file( a, "wb" )
+      output_file_name = a
     elif o in ("-i", "--indent"):
       indent_level = int(a)
+    elif o in ("-w", "--workers"):
+      workers = int(a)
+    elif o == "--host-connections":
+      host_connections = int(a)
+    elif o == "--retries":
+      retries = int(a)
+    elif o == "--cache-dir":
+      cache_dir = a
+    elif o == "--max-age":
+      cache_max_age = int(a)
+    elif o == "--cache-size":
+      cache_size = int(a) * 1024 * 1024
+    elif o == "--offline":
+      offline = True
+    elif o in ("-r", "--resume"):
+      resume = True
+    elif o in ("-s", "--since"):
+      since_file_name = a
+    elif o == "--stats":
+      stats_file_name = a
+    elif o == "--progress":
+      progress_interval = float(a)
     else:
       assert False, "unhandled option"
-  for i in range(1,page_total+1):
-    log("Getting page %s" % i)
-    content = get_page(i, start_date)
+  if page_total is None:
+    page_total = DEFAULT_INCREMENTAL_PAGES if since_file_name else 1
+  if results_format not in OUTPUT_FORMATS:
+    print "Unknown output format: %s" % results_format
+    usage()
+    sys.exit(2)
+  if resume and not output_file_name:
+    print "The --resume option requires an --output-file."
+    sys.exit(2)
+  if resume and results_format not in APPENDABLE_FORMATS:
+    print "Can not resume a crawl in the %s format, use one of: %s" % (results_format, ', '.join(APPENDABLE_FORMATS))
+    sys.exit(2)
+  if results_format == 'sqlite' and not output_file_name:
+    print "The sqlite format requires an --output-file."
+    sys.exit(2)
+  #read the previous output before it can be overwritten by the new one
+  if since_file_name:
+    known_pages, newest_day = load_known_photos(since_file_name)
+    log("%s photos known, the newest from %s." % (len(known_pages), newest_day))
+  if output_file_name:
+    #only append to the previous output if it was really written
+    resume = resume and os.path.exists(output_file_name)
+    if results_format == 'sqlite':
+      output_file = photo_db.PhotoDatabase(output_file_name)
+    else:
+      output_file = file( output_file_name, "ab" if resume else "wb" )
+    journal = checkpoint.Checkpoint(checkpoint.journal_path(output_file_name), resume)
+  request_scheduler = scheduler.RequestScheduler(host_connections, retries)
+  if cache_dir:
+    response_cache = http_cache.ResponseCache(cache_dir, cache_size, cache_max_age, offline)
+  elif offline:
+    print "The --offline option requires a --cache-dir."
+    sys.exit(2)
+  if results_format == 'sqlite':
+    #one transaction per page
+    writer = output_file.writer()
+  else:
+    writer = output_writers.open_writer(results_format, output_file, OUTPUT_KEYS, indent_level, not resume)
+  pages = range(1,page_total+1)
+  if journal:
+    done_pages = [i for i in pages if journal.done(journal_key(i, start_date))]
+    pages = sorted(set(pages) - set(done_pages))
+    if done_pages: log("Skipping %s pages completed on a previous run." % len(done_pages))
+    if pages and done_pages and pages[0] < done_pages[-1]:
+      print >> sys.stderr, "Pages missing from the previous run will be appended after page %s, sort %s again with merge_crawls.py to restore the date order." % (done_pages[-1], output_file_name)
+  stats.default_stats.progress_keys = ['pages', 'rows']
+  if progress_interval:
+    stats.default_stats.start_progress(progress_interval)
+  fetch = lambda i: (i, get_page(i, start_date))
+  for i, content in workerpool.ordered_map(fetch, pages, workers):
     if content:
-      table.extend(extract_data(content))
+      started = time.time()
+      rows = extract_data(content)
+      stats.default_stats.observe('parse.gallery', time.time() - started)
+      stats.default_stats.count('pages')
+      if known_pages is not None:
+        rows = [row for row in rows if row['photo_page'] not in known_pages and not (newest_day and row['pub_day'] < newest_day)]
+        known_pages.update([row['photo_page'] for row in rows])
+      writer.write_rows(rows)
+      stats.default_stats.count('rows', len(rows))
+      if journal: journal.mark(journal_key(i, start_date))
+      if known_pages is not None and not rows:
+        log("No new photos on page %s, stopping." % i)
+        break
     else:
+      stats.default_stats.count('pages.failed')
       print "No data."
-  print_results(table,results_format,output_file, indent_level)
+  writer.close()
   output_file.close()
+  if journal: journal.close()
+  stats.finish(stats_file_name)
   
 
 
+"""Read the photo pages and the newest pub_day of a previous crawl output, in
+any of the output formats.
+"""
+def load_known_photos(file_name):
+  known_pages = set()
+  newest_day = None
+  f = open(file_name, 'rb')
+  head = f.read(len(SQLITE_MAGIC))
+  f.seek(0)
+  if head == SQLITE_MAGIC:
+    f.close()
+    database = photo_db.PhotoDatabase(file_name)
+    rows = database.reader()
+  elif head.lstrip().startswith('['):
+    rows = json.load(f)
+  elif head.lstrip().startswith('{'):
+    rows = (json.loads(line) for line in f if line.strip())
+  else:
+    rows = csv.DictReader(f)
+  for row in rows:
+    known_pages.add(row['photo_page'])
+    if ISO_DAY_PATTERN.match(row.get('pub_day') or '') and row['pub_day'] > newest_day:
+      newest_day = row['pub_day']
+  if head == SQLITE_MAGIC:
+    database.close()
+  else:
+    f.close()
+  return known_pages, newest_day
+
+def page_offset(page_num):
+  return AGENCIA_BRASIL_PAGE_SIZE * page_num - AGENCIA_BRASIL_PAGE_SIZE
+
+"""The checkpoint journal entry of a gallery page, identified by its offset and
+the starting date of the crawl.
+"""
+def journal_key(page_num, start_date=None):
+  return "%s=%s date=%s" % (AGENCIA_BRASIL_PAGINATION_PARAM, page_offset(page_num), start_date or '')
+
 """Load the contents of a web page. Returns False if error or the content if success.
 """
 def get_page(page_num, start_date=None):
   log("Start date:%s" % start_date)
   date_range = "getDataPublicacao:date:list=%s+23:59:59&getDataPublicacao_usage=range:max" % (start_date) if start_date else ''
-  start = AGENCIA_BRASIL_PAGE_SIZE * page_num - AGENCIA_BRASIL_PAGE_SIZE
+  start = page_offset(page_num)
   gallery_url = "%s?%s&%s=%s" % (AGENCIA_BRASIL_GALLERY_URL, date_range, AGENCIA_BRASIL_PAGINATION_PARAM, start)
+  log("Getting page %s" % page_num)
   log("Acessing %s\t" % gallery_url)
   try:
-    f = urllib2.urlopen(gallery_url)
-    content = f.read()
+    if request_scheduler:
+      content = request_scheduler.call(gallery_url, lambda url: http_cache.fetch(url, response_cache))
+    else:
+      content = http_cache.fetch(gallery_url, response_cache)
     log("Success.")
     return content;
   except urllib2.HTTPError, e:
@@ -149,50 +317,37 @@ def get_page(page_num, start_date=None):
 """Convert a date in Portuguese (9 de Dezembro de 2009) to iso format 2009-12-09
 """
 def pt_to_iso_date(date_string):
-  months = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-  for i in range(0,12):
-    date_string = re.sub(r'([0-9]+) de %s de ([0-9]+)\s*' % months[i], r'\2-%s-\1' % (i+1), date_string)
-  date_string = re.sub(r'([0-9]+)-([0-9])-([0-9]+)', r'\1-0\2-\3', date_string)
-  date_string = re.sub(r'([0-9]+)-([0-9]+)-([0-9])', r'\1-\2-0\3', date_string)
-  return date_string
+  return ptdates.iso_day(date_string)
+
+IMAGE_ENTRY_PATTERN = re.compile('<div id="lista_banco_imagens_bloco">.*?<a href="([^"]*)".*?<img src="([^"]*)".*?<div class="nomeFotografo">(.*?)</div>.*?<block align="left" class="legendafoto2">(.*?)</block>', re.S|re.M)
+DATE_MARK_PATTERN = re.compile('class="chapeu1".*?>(.*?)<', re.S|re.M)
 
+"""Extract the photo entries of a gallery page in a single pass. The date
+marker of a group of photos is searched only between the end of the previous
+entry and the start of the current one, so each byte is scanned once.
+"""
 def extract_data(html, date='unknown'):
   photos = []
   last_date = date
-  while 1:
-    image_entry_pattern = '<div id="lista_banco_imagens_bloco">.*?<a href="([^"]*)".*?<img src="([^"]*)".*?<div class="nomeFotografo">(.*?)</div>.*?<block align="left" class="legendafoto2">(.*?)</block>'
-    matches = re.search(image_entry_pattern, html, re.S|re.M)
-    if matches:
-      text_before_match = matches.string[:matches.start(0)]
-      date_mark_pattern = 'class="chapeu1".*?>(.*?)<'
-      last_date_mark_matches = re.search(date_mark_pattern, text_before_match, re.S|re.M)
-      if last_date_mark_matches:
-        last_date = last_date_mark_matches.group(1)
-      photos.append({
-        'thumbnail_url' : matches.group(2),
-        'author' : matches.group(3),
-        'description' : matches.group(4),
-        'pub_day' : pt_to_iso_date(last_date),
-        'photo_page' : matches.group(1),
-      })
-      html = matches.string[matches.end(4):]
-    else: #no more matches
-      break
+  previous_end = 0
+  for matches in IMAGE_ENTRY_PATTERN.finditer(html):
+    last_date_mark_matches = DATE_MARK_PATTERN.search(html, previous_end, matches.start(0))
+    if last_date_mark_matches:
+      last_date = last_date_mark_matches.group(1)
+    photos.append({
+      'thumbnail_url' : matches.group(2),
+      'author' : matches.group(3),
+      'description' : matches.group(4),
+      'pub_day' : pt_to_iso_date(last_date),
+      'photo_page' : matches.group(1),
+    })
+    previous_end = matches.end(4)
   return photos
 
 def print_results(table, fmt, output_file, indent):
-  if fmt == 'csv':
-    keys = table[0].keys()
-    #write header
-    output_file.write("%s\n" % ','.join(keys))
-    #write rows
-    writer = csv.DictWriter(output_file, keys, quoting=csv.QUOTE_ALL)
-    writer.writerows(table)
-  elif fmt == 'json':
-    output = json.dumps(table,indent=indent)
-    output_file.write(output)
-  else:
-    print str(table)
+  writer = output_writers.open_writer(fmt, output_file, OUTPUT_KEYS, indent)
+  writer.write_rows(table)
+  writer.close()
   
 def log(m):
   if verbose: print(m)
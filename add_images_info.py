@@ -42,8 +42,17 @@ import sys
 import getopt
 import csv
 import os
+import time
+import itertools
+import multiprocessing
+import struct
+import dedup
+import image_probe
+import image_index
+import photo_db
+import image_download
+import stats
 from PIL import Image
-from PIL.ExifTags import TAGS
 
 #GLOBAL FLAGS
 verbose = None
@@ -51,6 +60,9 @@ verbose = None
 #CONSTANTS
 AGENCIA_BRASIL_IMAGES_FOLDER = "http://www.agenciabrasil.gov.br/media/imagens/"
 AGENCIA_BRASIL_VIEW_POSTFIX = "/view"
+PROBE_CHUNK_SIZE = 32
+#the EXIF tags copied to the table, by name
+EXIF_TAG_IDS = dict([(name, tag) for tag, name in image_probe.IFD0_TAGS.items() + image_probe.EXIF_TAGS.items()])
 
 def usage():
   print """
@@ -66,66 +78,155 @@ Parameters:
   -i, --input-file:\tThe ABrCrawl generated csv file to be used as input.
   -d, --images-dir:\tThe directory where the image files are.
   -o, --output-file:\tFile where to save the updated csv.
+  -b, --database:\tAn ABrCrawl sqlite database to update in place, instead of the input and output csv files.
   -c, --curl-config-file:\tFile to store a curl config with th URLs for missing and corrupted images.
+  --download:\t\tDownload the missing and corrupted images to the --images-dir and read them again (their rows go to the end of the output).
+  --download-workers:\tThe number of images downloaded at the same time (default %s).
+  --stats:\t\tSave probe timings, image counts and download counts to this JSON file.
+  --progress:\t\tPrint a progress line to stderr every N seconds.
+  -j, --jobs:\t\tThe number of processes reading image files at the same time (default 1).
+  --dedup-key:\t\tWhat makes two rows duplicated: %s (default row, all columns equal).
+  --dedup-db:\t\tKeep the rows already seen in this file instead of in memory, for very large inputs.
+  --duplicates-file:\tSave a csv report of the duplicated rows that were ignored.
+  --index-file:\t\tKeep the info read from each image in this file and only read new or changed images on the next runs.
   -v, --verbose:\tPrint extra info while performing the tasks.
-"""
+""" % (image_download.DEFAULT_WORKERS, ', '.join(dedup.DEDUP_KEYS))
 
 
 def updateRow(row, img, img_path):
-  photo_format = img.format
-  photo_width = img.size[0]
-  photo_height = img.size[1]
-  photo_orientation = 'landscape' if photo_width > photo_height else 'portrait'
-  photo_size = os.path.getsize(img_path)
-  exif_artist = ''
-  exif_flash = ''
-  exif_date_time_original = ''
-  exif_make = ''
-  exif_model = ''
-  exif_software = ''
-  exif_info = None
-  try:
-    exif_info = img._getexif()
-  except Exception as e:
-    pass
-  if exif_info:
-    for tag, value in exif_info.items():
-      decoded = str(TAGS.get(tag, tag))
-      value = str(value).strip()
-      if decoded == 'DateTimeOriginal': exif_date_time_original = value
-      if decoded == 'Make': exif_make = value
-      if decoded == 'Model': exif_model = value
-      if decoded == 'Flash': exif_flash = value
-      if decoded == 'Software': exif_software = value
-      if decoded == 'Artist': exif_artist = value
+  return row_with_info(row, image_info(img, img_path))
+
+"""Copy the ABrCrawl columns of a row and add the columns with the image info.
+"""
+def row_with_info(row, info):
   new_row = {
     'pub_day':row['pub_day'],
     'thumbnail_url':row['thumbnail_url'],
     'photo_page':row['photo_page'],
     'description':row['description'],
     'author':row['author'],
+  }
+  new_row.update(info)
+  return new_row
+
+"""Read the format, dimensions, file size and some EXIF tags of an opened image.
+"""
+def image_info(img, img_path):
+  exif = {}
+  exif_info = None
+  try:
+    exif_info = img._getexif()
+  except Exception as e:
+    pass
+  if exif_info:
+    for name, tag in EXIF_TAG_IDS.items():
+      if tag in exif_info:
+        exif[name] = str(exif_info[tag])
+  return build_info(img.format, img.size[0], img.size[1], os.path.getsize(img_path), exif)
+
+"""Read the same info as image_info() from the JPEG headers only, without
+going through PIL. Returns None for files the probe can not handle.
+"""
+def quick_image_info(img_path):
+  try:
+    probed = image_probe.probe_jpeg(img_path)
+  except (image_probe.ProbeError, struct.error):
+    return None
+  if probed is None:
+    return None
+  photo_width, photo_height, exif = probed
+  return build_info('JPEG', photo_width, photo_height, os.path.getsize(img_path), exif)
+
+def build_info(photo_format, photo_width, photo_height, photo_size, exif):
+  photo_orientation = 'landscape' if photo_width > photo_height else 'portrait'
+  return {
     'photo_format':photo_format, 
     'photo_orientation':photo_orientation, 
     'photo_width':photo_width, 
     'photo_height':photo_height, 
     'photo_size':photo_size,
-    'exif_artist':exif_artist, 
-    'exif_flash':exif_flash, 
-    'exif_date_time_original':exif_date_time_original, 
-    'exif_make':exif_make, 
-    'exif_model':exif_model, 
-    'exif_software':exif_software
+    'exif_artist':exif.get('Artist', '').strip(), 
+    'exif_flash':exif.get('Flash', '').strip(), 
+    'exif_date_time_original':exif.get('DateTimeOriginal', '').strip(), 
+    'exif_make':exif.get('Make', '').strip(), 
+    'exif_model':exif.get('Model', '').strip(), 
+    'exif_software':exif.get('Software', '').strip()
   }
-  return new_row
+
+"""Open the local copy of an image and read its info. The task is a
+(row, abr_filename, image_path, cached) tuple, it is returned together with
+the status ('ok', 'missing' or 'corrupted'), the info (None unless 'ok') and
+the seconds spent reading the file. When cached holds the (status, info) found
+in the --index-file the file is not opened at all and the time is None. JPEG
+files are read by the header probe, PIL is used for everything else. Runs in
+the worker processes when --jobs is used.
+"""
+def probe_image(task):
+  row, abr_filename, image_path, cached = task
+  if cached:
+    return task, cached[0], cached[1], None
+  started = time.time()
+  status, info = read_image(image_path)
+  return task, status, info, time.time() - started
+
+def read_image(image_path):
+  #there is no local copy for the image
+  if not os.path.exists(image_path):
+    return 'missing', None
+  #local file exists, try to open it
+  try:
+    info = quick_image_info(image_path)
+    if info is None:
+      img = Image.open(image_path)
+      info = image_info(img, image_path)
+    return 'ok', info
+  #local file is corrupted
+  except IOError as e:
+    return 'corrupted', None
+
+"""The file name of a row's image on the ABr server and the path of its local
+copy in images_dir.
+"""
+def local_image(row, images_dir):
+  abr_filename = row['photo_page'][len(AGENCIA_BRASIL_IMAGES_FOLDER):-len(AGENCIA_BRASIL_VIEW_POSTFIX)]
+  return abr_filename, "%s/%s" % (images_dir, abr_filename.replace('/','_'))
+
+"""The (status, info) saved in the index for an image file, if the file did not
+change since then.
+"""
+def indexed_info(index, image_path):
+  if not index: return None
+  try:
+    stat = os.stat(image_path)
+  except OSError:
+    return None
+  return index.lookup(os.path.basename(image_path), stat.st_size, stat.st_mtime)
+
+def index_info(index, image_path, status, info):
+  try:
+    stat = os.stat(image_path)
+  except OSError:
+    return
+  index.store(os.path.basename(image_path), stat.st_size, stat.st_mtime, status, info)
 
 def main():
   global verbose
   output_file = sys.stdout
   curl_config_file = None
+  jobs = 1
+  dedup_key = 'row'
+  dedup_db = None
+  duplicates_file = None
+  index = None
+  database = None
+  download = False
+  download_workers = image_download.DEFAULT_WORKERS
+  stats_file_name = None
+  progress_interval = 0
   if(len(sys.argv) < 2):
     return usage()
   try:
-    opts, args = getopt.getopt(sys.argv[1:], "hi:d:o:c:v", ["help", "input-file=", "images-dir=", "output-file=", "curl-config-file", "verbose"])
+    opts, args = getopt.getopt(sys.argv[1:], "hi:d:o:c:vj:b:", ["help", "input-file=", "database=", "images-dir=", "output-file=", "curl-config-file=", "verbose", "jobs=", "dedup-key=", "dedup-db=", "duplicates-file=", "index-file=", "download", "download-workers=", "stats=", "progress="])
   except getopt.GetoptError, err:
     # print help information and exit:
     print str(err) # will print something like "option -a not recognized"
@@ -141,47 +242,123 @@ def main():
       images_dir = a
     elif o in ("-o", "--output-file"):
       output_file = file( a, "wb" )
+    elif o in ("-b", "--database"):
+      database = photo_db.PhotoDatabase(a)
     elif o in ("-c", "--curl-config-file"):
       curl_config_file = open( a, "wb" )
     elif o in ("-v", "--verbose"):
       verbose = True
+    elif o in ("-j", "--jobs"):
+      jobs = int(a)
+    elif o == "--dedup-key":
+      dedup_key = a
+    elif o == "--dedup-db":
+      dedup_db = a
+    elif o == "--duplicates-file":
+      duplicates_file = open( a, "wb" )
+    elif o == "--index-file":
+      index = image_index.ImageIndex(a)
+    elif o == "--download":
+      download = True
+    elif o == "--download-workers":
+      download_workers = int(a)
+    elif o == "--stats":
+      stats_file_name = a
+    elif o == "--progress":
+      progress_interval = float(a)
     else:
       assert False, "unhandled option"
+  if dedup_key not in dedup.DEDUP_KEYS:
+    print "Unknown dedup key: %s" % dedup_key
+    usage()
+    sys.exit(2)
   new_table = []
   not_found_files = []
   corrupted_images = []
-  passed_rows = []
-  rows_updated = 1
-  duplicated_rows = 0
-  input_reader = csv.DictReader(input_file)
-  ignore_url_until = len(AGENCIA_BRASIL_IMAGES_FOLDER)
-  ignore_url_after = len(AGENCIA_BRASIL_VIEW_POSTFIX)
+  passed_rows = dedup.open_seen_set(dedup_db)
+  duplicates_writer = None
+  retry_tasks = []
+  counts = {'duplicated': 0, 'updated': 1}
+  if database:
+    input_reader = database.reader()
+    database_writer = database.writer(photo_db.WRITE_BATCH_SIZE)
+  else:
+    input_reader = csv.DictReader(input_file)
+  if duplicates_file:
+    duplicates_writer = csv.writer(duplicates_file, quoting=csv.QUOTE_ALL)
+    duplicates_writer.writerow(['line', 'first_line'] + input_reader.fieldnames)
   #copy csv data to the new table
   log('reading input csv file…')
   #look for the image files in the --images-dir and update the rows with new columns
   log('retrieving local images info…')
-  for row in input_reader:
-    if row in passed_rows:
-      duplicated_rows = duplicated_rows + 1
-      continue
-    passed_rows.append(row)
-    abr_filename = row['photo_page'][ignore_url_until:-ignore_url_after]
-    local_filename = abr_filename.replace('/','_')
-    image_path = "%s/%s" % (images_dir,local_filename)
-    #first row or empty row or empty image url, skip
-    if local_filename == '': continue
+  def pending_images():
+    for row in input_reader:
+      first_line = passed_rows.add(dedup.row_fingerprint(row, dedup_key), input_reader.line_num)
+      if first_line is not None:
+        counts['duplicated'] = counts['duplicated'] + 1
+        if duplicates_writer:
+          duplicates_writer.writerow([input_reader.line_num, first_line] + [row.get(key) for key in input_reader.fieldnames])
+        continue
+      abr_filename, image_path = local_image(row, images_dir)
+      #first row or empty row or empty image url, skip
+      if abr_filename == '': continue
+      yield (row, abr_filename, image_path, indexed_info(index, image_path))
+  if jobs > 1:
+    pool = multiprocessing.Pool(jobs)
+    results = pool.imap(probe_image, pending_images(), PROBE_CHUNK_SIZE)
+  else:
+    results = itertools.imap(probe_image, pending_images())
+  def handle_result(task, status, info, seconds):
+    row, abr_filename, image_path, cached = task
+    stats.default_stats.count('images.%s' % status)
+    if seconds is None:
+      stats.default_stats.count('images.indexed')
+    else:
+      stats.default_stats.observe('probe', seconds)
+    if index and not cached and status != 'missing':
+      index_info(index, image_path, status, info)
     #there is no local copy for the image, update the not found image list
-    if not os.path.exists(image_path):
+    if status == 'missing':
       not_found_files.append(abr_filename)
-      continue
-    #local file exists, try to open it
-    try:
-      img = Image.open(image_path)
-      new_table.append(updateRow(row, img, image_path))
-      rows_updated = rows_updated + 1
+      retry_tasks.append(task)
     #local file is corrupted, updated corrupted list
-    except IOError as e:
+    elif status == 'corrupted':
       corrupted_images.append(abr_filename)
+      retry_tasks.append(task)
+    else:
+      if database:
+        database_writer.write_rows([row_with_info(row, info)])
+      else:
+        new_table.append(row_with_info(row, info))
+      counts['updated'] = counts['updated'] + 1
+      stats.default_stats.count('rows')
+  stats.default_stats.progress_keys = ['rows', 'images.missing', 'images.corrupted']
+  if progress_interval:
+    stats.default_stats.start_progress(progress_interval)
+  #rows come back in input order
+  for result in results:
+    handle_result(*result)
+  if jobs > 1:
+    pool.close()
+    pool.join()
+  #fetch the images that could not be read and read them again
+  if download and retry_tasks:
+    log('downloading %s missing and corrupted images…' % len(retry_tasks))
+    tasks = retry_tasks[:]
+    del retry_tasks[:]
+    del not_found_files[:]
+    del corrupted_images[:]
+    downloads = [(AGENCIA_BRASIL_IMAGES_FOLDER + abr_filename, image_path) for row, abr_filename, image_path, cached in tasks]
+    for (row, abr_filename, image_path, cached), (url, path, success) in zip(tasks, image_download.download_all(downloads, download_workers)):
+      log('%s %s' % (url, 'downloaded.' if success else 'failed.'))
+      stats.default_stats.count('downloads.ok' if success else 'downloads.failed')
+      handle_result(*probe_image((row, abr_filename, image_path, None)))
+  passed_rows.close()
+  if duplicates_file: duplicates_file.close()
+  if index:
+    log('%s images read from the index, %s images opened.' % (index.hits, index.misses))
+    index.close()
+  duplicated_rows = counts['duplicated']
   #info about some images could not be retrieved, generate a curl config file for the user to download the missing images
   if curl_config_file and (len(not_found_files)>0 or len(corrupted_images) > 0):
     curl_config = ''
@@ -192,9 +369,15 @@ def main():
     for filename in corrupted_images:
       curl_config = curl_config + 'url = "%s%s"\noutput = "%s"\n' % (AGENCIA_BRASIL_IMAGES_FOLDER, filename, filename.replace('/','_'))
     curl_config_file.write(curl_config)
-  print_results(new_table,output_file)
+  if database:
+    database_writer.close()
+    database.close()
+  else:
+    print_results(new_table,output_file)
   # log(new_table)
-  log('Update finished. %s rows updated, %s duplicated rows ignored, %s files missing, %s files corrupted.' % (rows_updated, duplicated_rows, len(not_found_files), len(corrupted_images)))
+  stats.default_stats.count('rows.duplicated', duplicated_rows)
+  stats.finish(stats_file_name)
+  log('Update finished. %s rows updated, %s duplicated rows ignored, %s files missing, %s files corrupted.' % (counts['updated'], duplicated_rows, len(not_found_files), len(corrupted_images)))
 
 def print_results(table, output_file):
   keys = [
@@ -45,9 +45,23 @@ import csv
 import urllib2
 import re
 import os
+import time
+import http_cache
+import checkpoint
+import output_writers
+import workerpool
+import scheduler
+import photo_db
+import stats
+import ptdates
+
+#CONSTANTS
+DEFAULT_HOST_CONNECTIONS = 4
 
 #GLOBAL FLAGS
 verbose = None
+response_cache = None
+request_scheduler = None
 
 def usage():
   print """
@@ -61,16 +75,42 @@ Parameters:
   -h, --help:\t\tPrint this message.
   -i, --input-file:\tThe ABrCrawl generated csv file to be used as input.
   -o, --output-file:\tFile where to save the updated csv.
+  -b, --database:\tAn ABrCrawl sqlite database to update in place, instead of the input and output csv files.
+  --cache-dir:\t\tKeep downloaded pages in this directory and reuse them on later runs.
+  --max-age:\t\tSeconds a cached page is used without asking the server if it changed (default 0).
+  --cache-size:\t\tMaximum size of the cache directory in megabytes (default %s).
+  --offline:\t\tOnly use pages from the cache, never access the network.
+  -r, --resume:\t\tContinue an interrupted run, skipping the rows already saved to the --output-file.
+  -w, --workers:\tThe number of pages to download and parse at the same time (default 1).
+  --host-connections:\tThe maximum number of simultaneous requests to the same host (default %s). The limit starts at 1, grows while the host answers normally and is halved when it is overloaded.
+  --retries:\t\tThe number of times a request is tried again after a timeout or an error like 503 (default %s).
+  --rate:\t\tThe maximum number of requests per second sent to the same host (default no limit).
+  --stats:\t\tSave timings, HTTP status counts, bytes downloaded and cache hit rates to this JSON file.
+  --progress:\t\tPrint a progress line to stderr every N seconds.
   -v, --verbose:\tPrint extra info while performing the tasks.
-"""
+""" % (http_cache.DEFAULT_MAX_SIZE / (1024 * 1024), DEFAULT_HOST_CONNECTIONS, scheduler.DEFAULT_RETRIES)
 
 def main():
-  global verbose
+  global verbose, response_cache, request_scheduler
   output_file = sys.stdout
+  output_file_name = None
+  database = None
+  resume = False
+  journal = None
+  cache_dir = None
+  cache_max_age = 0
+  cache_size = http_cache.DEFAULT_MAX_SIZE
+  offline = False
+  workers = 1
+  host_connections = DEFAULT_HOST_CONNECTIONS
+  retries = scheduler.DEFAULT_RETRIES
+  rate = 0
+  stats_file_name = None
+  progress_interval = 0
   if(len(sys.argv) < 2):
     return usage()
   try:
-    opts, args = getopt.getopt(sys.argv[1:], "hi:o:v", ["help", "input-file=", "output-file=", "verbose"])
+    opts, args = getopt.getopt(sys.argv[1:], "hi:o:vrw:b:", ["help", "input-file=", "output-file=", "database=", "verbose", "cache-dir=", "max-age=", "cache-size=", "offline", "resume", "workers=", "host-connections=", "retries=", "rate=", "stats=", "progress="])
   except getopt.GetoptError, err:
     # print help information and exit:
     print str(err) # will print something like "option -a not recognized"
@@ -83,29 +123,137 @@ def main():
     elif o in ("-i", "--input-file"):
       input_file = file( a, "r" )
     elif o in ("-o", "--output-file"):
-      output_file = file( a, "wb" )
+      output_file_name = a
+    elif o in ("-b", "--database"):
+      database = photo_db.PhotoDatabase(a)
     elif o in ("-v", "--verbose"):
       verbose = True
+    elif o == "--cache-dir":
+      cache_dir = a
+    elif o == "--max-age":
+      cache_max_age = int(a)
+    elif o == "--cache-size":
+      cache_size = int(a) * 1024 * 1024
+    elif o == "--offline":
+      offline = True
+    elif o in ("-r", "--resume"):
+      resume = True
+    elif o in ("-w", "--workers"):
+      workers = int(a)
+    elif o == "--host-connections":
+      host_connections = int(a)
+    elif o == "--retries":
+      retries = int(a)
+    elif o == "--rate":
+      rate = float(a)
+    elif o == "--stats":
+      stats_file_name = a
+    elif o == "--progress":
+      progress_interval = float(a)
     else:
       assert False, "unhandled option"
-  input_reader = csv.DictReader(input_file)
-  new_table = []
-  keys = input_reader.fieldnames
-  new_keys = keys[:]
-  new_keys.extend(['created_date', 'updated_date'])
-  for row in input_reader:
-    log('Line #%s.' % (input_reader.line_num-1))
-    url = row['photo_page']
-    page_content = get_page_contents(url)
-    dates = extract_abr_date_string(page_content)
+  if cache_dir:
+    response_cache = http_cache.ResponseCache(cache_dir, cache_size, cache_max_age, offline)
+  elif offline:
+    print "The --offline option requires a --cache-dir."
+    sys.exit(2)
+  if resume and not (output_file_name or database):
+    print "The --resume option requires an --output-file."
+    sys.exit(2)
+  if database:
+    #rows that already have their dates are done, no journal needed
+    resume = True
+  elif output_file_name:
+    #only append to the previous output if it was really written
+    resume = resume and os.path.exists(output_file_name)
+    output_file = file( output_file_name, "ab" if resume else "wb" )
+    journal = checkpoint.Checkpoint(checkpoint.journal_path(output_file_name), resume)
+  request_scheduler = scheduler.RequestScheduler(host_connections, retries, rate)
+  if database:
+    input_reader = database.reader('created_date IS NULL')
+    writer = database.writer(photo_db.WRITE_BATCH_SIZE)
+    output_file = database
+  else:
+    input_reader = csv.DictReader(input_file)
+    keys = input_reader.fieldnames
+    new_keys = keys[:]
+    new_keys.extend(['created_date', 'updated_date'])
+    writer = output_writers.CsvWriter(output_file, new_keys, not resume)
+  counts = {'skipped': 0, 'failed': 0}
+  occurrences = {}
+  def pending_rows():
+    for row in input_reader:
+      log('Line #%s.' % (input_reader.line_num-1))
+      #a photo page listed again gets its own key, so each of its rows is journaled
+      occurrence = occurrences.get(row['photo_page'], 0) + 1
+      occurrences[row['photo_page']] = occurrence
+      key = journal_key(row['photo_page'], occurrence)
+      if resume and journal and journal.done(key):
+        counts['skipped'] = counts['skipped'] + 1
+        continue
+      yield key, row
+  def enrich(item):
+    key, row = item
+    return (key,) + enrich_row(row)
+  stats.default_stats.progress_keys = ['rows', 'rows.failed']
+  if progress_interval:
+    stats.default_stats.start_progress(progress_interval)
+  #pages are downloaded and parsed by the workers, rows come back in input order
+  for key, row, dates in workerpool.ordered_map(enrich, pending_rows(), workers):
+    #the page could not be downloaded this time, leave the row for a --resume run
+    if dates is None:
+      counts['failed'] = counts['failed'] + 1
+      stats.default_stats.count('rows.failed')
+      continue
     log(dates)
-    pass
+    row['created_date'], row['updated_date'] = dates
+    if database:
+      #only touch the new columns
+      row = {'photo_page': row['photo_page'], 'created_date': row['created_date'], 'updated_date': row['updated_date']}
+    writer.write_rows([row])
+    stats.default_stats.count('rows')
+    if journal: journal.mark(key)
+  writer.close()
+  output_file.close()
+  if journal: journal.close()
+  stats.default_stats.count('rows.skipped', counts['skipped'])
+  stats.finish(stats_file_name)
+  log('Update finished. %s rows skipped from a previous run, %s rows could not be downloaded (left for a --resume run).' % (counts['skipped'], counts['failed']))
+
+"""Download the photo page of a row and extract its dates. Returns the row and
+the [created, updated] dates, or None as dates if the page could not be loaded
+but may load later. Pages that will never load (like a 404) get empty dates.
+"""
+def enrich_row(row):
+  page_content = get_page_contents(row['photo_page'])
+  if page_content is False:
+    return row, None
+  if page_content is None:
+    stats.default_stats.count('rows.unavailable')
+    return row, ['', '']
+  started = time.time()
+  dates = extract_abr_date_string(page_content)
+  stats.default_stats.observe('parse.photo', time.time() - started)
+  return row, dates or ['', '']
 
+"""The checkpoint journal entry of a row, identified by its photo page url and,
+from the second row with the same url on, by how many times it was listed.
+"""
+def journal_key(url, occurrence=1):
+  if occurrence > 1:
+    return "photo_page=%s occurrence=%s" % (url, occurrence)
+  return "photo_page=%s" % url
+
+"""The content of a page, False after an error worth trying again later (a
+timeout, a 503...) or None after a permanent one (a 404...).
+"""
 def get_page_contents(url):
   log("Acessing %s\t" % url)
   try:
-    f = urllib2.urlopen(url)
-    content = f.read()
+    if request_scheduler:
+      content = request_scheduler.call(url, lambda url: http_cache.fetch(url, response_cache))
+    else:
+      content = http_cache.fetch(url, response_cache)
     log("Success.")
     return content;
   except urllib2.HTTPError, e:
@@ -117,35 +265,24 @@ def get_page_contents(url):
       log('Service unavailable.')
     else:
       log('Unknown error: ')
+    if scheduler.classify(e) is None: return None
   except urllib2.URLError, e:
     log("Error %s" % e.reason)
+    if scheduler.classify(e) is None: return None
   return False
 
+DATE_LINE_PATTERN = re.compile('<div class="documentByLine">.*?<span>.*?([0-9]+ de .*? de [0-9]+ - ..h..).*?</span>.*?</span>.*?([0-9]+ de .*? de [0-9]+ - ..h..)', re.S|re.M)
+
+"""The [created, updated] ISO timestamps of a photo page, or None.
+"""
 def extract_abr_date_string(html):
-  date_pattern = '<div class="documentByLine">.*?<span>.*?([0-9]+) de (.*?) de ([0-9]+) - (..)h(..).*?</span>.*?</span>.*?([0-9]+) de (.*?) de ([0-9]+) - (..)h(..)'
-  matches = re.search(date_pattern, html, re.S|re.M)
+  matches = DATE_LINE_PATTERN.search(html)
   if matches:
-    created_date_day = matches.group(1)
-    created_date_month = matches.group(2)
-    created_date_year = matches.group(3)
-    created_date_hour = matches.group(4)
-    created_date_minute = matches.group(5)
-    updated_date_day = matches.group(6)
-    updated_date_month = matches.group(7)
-    updated_date_year = matches.group(8)
-    updated_date_hour = matches.group(9)
-    updated_date_minute = matches.group(10)
-    months = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    for i in range(0,12):
-      created_date_month = re.sub(months[i], str(i+1), created_date_month)
-      updated_date_month = re.sub(months[i], str(i+1), updated_date_month)
-    return [
-              ('%d-%02d-%02dT%02d:%02d-03:00' % (int(created_date_year), int(created_date_month), int(created_date_day), int(created_date_hour), int(created_date_minute))),
-              ('%d-%02d-%02dT%02d:%02d-03:00' % (int(updated_date_year), int(updated_date_month), int(updated_date_day), int(updated_date_hour), int(updated_date_minute)))
-            ]
-  else:
-    log('no matches')
-  
+    dates = ptdates.iso_timestamps(matches.groups())
+    if None not in dates:
+      return dates
+  log('no matches')
+
 def extract_abr_cloudwords(html):
   #                                 <div id="cloudwords" class="assuntos1">
   #                                     
@@ -160,6 +297,7 @@ def extract_abr_cloudwords(html):
   #                                     
   #                                 </div>
   # 
+  pass
 
 def log(m):
   global verbose
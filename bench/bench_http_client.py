@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# BenchHTTPClient: Compare the number of TCP connections opened (and the time
+# spent) by urllib2.urlopen and by the shared keep-alive HTTPClient when
+# downloading the same page many times from a local stand-in HTTP server.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import sys
+import time
+import getopt
+import threading
+import urllib2
+import BaseHTTPServer
+import SocketServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import http_client
+import workerpool
+
+PAGE = '<html><body>%s</body></html>' % ('<div id="lista_banco_imagens_bloco"></div>\n' * 200)
+
+def usage():
+  print """
+BenchHTTPClient
+http://github.com/fczuardi/abrcrawl
+
+Count the connections opened per batch of requests by urllib2.urlopen and by
+http_client.HTTPClient against a local HTTP/1.1 server.
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -n, --requests:\tThe number of requests sent by each client (default 1000).
+  -w, --workers:\tThe number of threads sending requests (default 4).
+"""
+
+class ConnectionCounter(object):
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.connections = 0
+
+  def add(self):
+    self.lock.acquire()
+    self.connections = self.connections + 1
+    self.lock.release()
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+
+  def setup(self):
+    BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+    self.server.counter.add()
+
+  def do_GET(self):
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/html')
+    self.send_header('Content-Length', str(len(PAGE)))
+    self.end_headers()
+    self.wfile.write(PAGE)
+
+  def log_message(self, *args):
+    pass
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+  request_queue_size = 128
+
+def run(name, fetch, url, requests, workers, server):
+  server.counter.connections = 0
+  start = time.time()
+  for body in workerpool.ordered_map(fetch, [url] * requests, workers):
+    assert body == PAGE
+  elapsed = time.time() - start
+  print "%s\t%s requests\t%s connections\t%.2fs\t%.0f requests/s" % (name, requests, server.counter.connections, elapsed, requests / elapsed)
+
+def main():
+  requests = 1000
+  workers = 4
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hn:w:", ["help", "requests=", "workers="])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-n", "--requests"):
+      requests = int(a)
+    elif o in ("-w", "--workers"):
+      workers = int(a)
+  server = StubServer(('127.0.0.1', 0), StubHandler)
+  server.counter = ConnectionCounter()
+  thread = threading.Thread(target=server.serve_forever)
+  thread.setDaemon(True)
+  thread.start()
+  url = 'http://127.0.0.1:%s/imagens/banco_de_imagens_view/lista' % server.server_address[1]
+  run('urllib2', lambda u: urllib2.urlopen(u).read(), url, requests, workers, server)
+  client = http_client.HTTPClient()
+  run('http_client', client.get, url, requests, workers, server)
+  client.close()
+  server.shutdown()
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# BenchPtDates: Compare the shared ptdates module with the date conversion
+# code that abrcrawl.py and add_proper_dates.py used before it, checking that
+# both give the same results.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import re
+import sys
+import csv
+import time
+import getopt
+import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import ptdates
+import add_proper_dates
+import stub_server
+
+#CONSTANTS
+DATA_FILE = os.path.join(BENCH_DIR, '..', 'data', '2006.csv')
+
+def usage():
+  print """
+BenchPtDates
+http://github.com/fczuardi/abrcrawl
+
+Time the conversion of the pub_day of every row of data/2006.csv (as the
+gallery pages write it) and of the dates of the fixture photo pages, with the
+old per month re.sub loops and with the ptdates module.
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -r, --repeat:\t\tThe number of times each input list is converted (default 20).
+"""
+
+"""abrcrawl.pt_to_iso_date before ptdates.
+"""
+def legacy_pt_to_iso_date(date_string):
+  months = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+  for i in range(0,12):
+    date_string = re.sub(r'([0-9]+) de %s de ([0-9]+)\s*' % months[i], r'\2-%s-\1' % (i+1), date_string)
+  date_string = re.sub(r'([0-9]+)-([0-9])-([0-9]+)', r'\1-0\2-\3', date_string)
+  date_string = re.sub(r'([0-9]+)-([0-9]+)-([0-9])(?![0-9])', r'\1-\2-0\3', date_string)
+  return date_string
+
+"""add_proper_dates.extract_abr_date_string before ptdates.
+"""
+def legacy_extract_abr_date_string(html):
+  date_pattern = '<div class="documentByLine">.*?<span>.*?([0-9]+) de (.*?) de ([0-9]+) - (..)h(..).*?</span>.*?</span>.*?([0-9]+) de (.*?) de ([0-9]+) - (..)h(..)'
+  matches = re.search(date_pattern, html, re.S|re.M)
+  if matches:
+    groups = list(matches.groups())
+    months = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+    for i in range(0,12):
+      groups[1] = re.sub(months[i], str(i+1), groups[1])
+      groups[6] = re.sub(months[i], str(i+1), groups[6])
+    return ['%d-%02d-%02dT%02d:%02d-03:00' % (int(groups[2]), int(groups[1]), int(groups[0]), int(groups[3]), int(groups[4])),
+            '%d-%02d-%02dT%02d:%02d-03:00' % (int(groups[7]), int(groups[6]), int(groups[5]), int(groups[8]), int(groups[9]))]
+
+"""The pub_day of each row of data/2006.csv written back the way the gallery
+pages show it (31 de Dezembro de 2006).
+"""
+def day_marks():
+  marks = []
+  for row in csv.DictReader(open(DATA_FILE, 'rb')):
+    day = datetime.date(*map(int, row['pub_day'].split('-')))
+    marks.append('%s de %s de %s' % (day.day, ptdates.MONTHS[day.month - 1], day.year))
+  return marks
+
+"""Photo pages with every day of 2006 and the fixture pages.
+"""
+def photo_pages():
+  galleries, pages = stub_server.load_fixtures()
+  template = pages[0]
+  found = re.search(r'Criado em ([^<]*?) - (..h..)', template)
+  day = datetime.date(2006, 1, 1)
+  while day.year == 2006:
+    text = '%s de %s de %s' % (day.day, ptdates.MONTHS[day.month - 1], day.year)
+    pages.append(template.replace(found.group(1), text))
+    day = day + datetime.timedelta(days=1)
+  return pages
+
+def timed(func, values, repeat, clear=None):
+  start = time.time()
+  for i in range(repeat):
+    if clear: clear()
+    func(values)
+  return (time.time() - start) * 1000000 / (repeat * len(values))
+
+def main():
+  repeat = 20
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hr:", ["help", "repeat="])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-r", "--repeat"):
+      repeat = int(a)
+  marks = day_marks()
+  pages = photo_pages()
+  assert map(legacy_pt_to_iso_date, marks) == ptdates.iso_days(marks)
+  assert map(legacy_extract_abr_date_string, pages) == map(add_proper_dates.extract_abr_date_string, pages)
+  print "day dates\t%s values, %s distinct" % (len(marks), len(set(marks)))
+  print "  legacy pt_to_iso_date\t%.2f us/value" % timed(lambda values: map(legacy_pt_to_iso_date, values), marks, repeat)
+  print "  convert_day (no cache)\t%.2f us/value" % timed(lambda values: map(ptdates.convert_day, values), marks, repeat)
+  print "  iso_days (cold cache)\t%.2f us/value" % timed(ptdates.iso_days, marks, repeat, ptdates.iso_day.clear)
+  print "  iso_days (warm cache)\t%.2f us/value" % timed(ptdates.iso_days, marks, repeat)
+  print "photo pages\t%s pages" % len(pages)
+  print "  legacy extract_abr_date_string\t%.2f us/page" % timed(lambda values: map(legacy_extract_abr_date_string, values), pages, repeat)
+  print "  extract_abr_date_string (cold cache)\t%.2f us/page" % timed(lambda values: map(add_proper_dates.extract_abr_date_string, values), pages, repeat, ptdates.iso_timestamp.clear)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# CheckAddProperDates: Check that add_proper_dates.py writes the same rows with
+# one or several workers, and after a resumed run.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import sys
+import csv
+import shutil
+import getopt
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, ROOT_DIR)
+import stub_server
+
+#CONSTANTS
+DATA_FILE = os.path.join(ROOT_DIR, 'data', '2006.csv')
+TOOL = os.path.join(ROOT_DIR, 'add_proper_dates.py')
+DEFAULT_ROWS = 300
+DEFAULT_WORKERS = 4
+#every REPEAT_STEP-th row is listed again at the end of the input
+REPEAT_STEP = 10
+
+verbose = False
+
+def usage():
+  print """
+CheckAddProperDates
+http://github.com/fczuardi/abrcrawl
+
+Run add_proper_dates.py on rows of data/2006.csv (pointed at a local stub
+server, with some photo pages listed twice) with one worker, with several
+workers and as an interrupted run continued with --resume, and check that
+the three outputs are the same and have a row for every input row.
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -r, --rows:\t\tThe number of rows of data/2006.csv to use (default %s).
+  -w, --workers:\tThe number of workers of the concurrent run (default %s).
+  -v, --verbose:\tShow the output of the tool.
+""" % (DEFAULT_ROWS, DEFAULT_WORKERS)
+
+"""Write the first `count` rows of data/2006.csv, with the photo pages on the
+stub server, and then every REPEAT_STEP-th of them again.
+"""
+def make_input(path, count, base_url):
+  reader = csv.DictReader(open(DATA_FILE, 'rb'))
+  rows = []
+  for row in reader:
+    if len(rows) >= count: break
+    row['photo_page'] = row['photo_page'].replace(stub_server.ORIGINAL_HOST, base_url)
+    rows.append(row)
+  rows.extend(rows[::REPEAT_STEP])
+  f = open(path, 'wb')
+  writer = csv.DictWriter(f, reader.fieldnames, quoting=csv.QUOTE_ALL)
+  f.write('%s\n' % ','.join(reader.fieldnames))
+  writer.writerows(rows)
+  f.close()
+  return len(rows)
+
+def run_tool(args):
+  output = None if verbose else open(os.devnull, 'wb')
+  status = subprocess.call([sys.executable, TOOL] + args, stdout=output, stderr=output)
+  if output: output.close()
+  if status:
+    raise RuntimeError('add_proper_dates.py exited with status %s' % status)
+
+def read(path):
+  f = open(path, 'rb')
+  content = f.read()
+  f.close()
+  return content
+
+"""The first `lines` lines (header included) of a csv file, as an input cut
+short.
+"""
+def head(path, head_path, lines):
+  f = open(head_path, 'wb')
+  for i, line in enumerate(open(path, 'rb')):
+    if i >= lines: break
+    f.write(line)
+  f.close()
+
+def main():
+  global verbose
+  count = DEFAULT_ROWS
+  workers = DEFAULT_WORKERS
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hr:w:v", ["help", "rows=", "workers=", "verbose"])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-r", "--rows"):
+      count = int(a)
+    elif o in ("-w", "--workers"):
+      workers = int(a)
+    elif o in ("-v", "--verbose"):
+      verbose = True
+  server = stub_server.StubServer(0)
+  server.start()
+  work_dir = tempfile.mkdtemp(prefix='abrcrawl-check-')
+  failed = 0
+  try:
+    input_file = os.path.join(work_dir, 'input.csv')
+    rows = make_input(input_file, count, server.base_url)
+    single = os.path.join(work_dir, 'single.csv')
+    run_tool(['-i', input_file, '-o', single, '-w', '1'])
+    written = len(read(single).splitlines()) - 1
+    print "input\t%s rows, -w 1 wrote %s rows" % (rows, written)
+    if written != rows:
+      failed = failed + 1
+      print "  DIFFERENT row count"
+    concurrent = os.path.join(work_dir, 'concurrent.csv')
+    run_tool(['-i', input_file, '-o', concurrent, '-w', str(workers)])
+    same = read(concurrent) == read(single)
+    print "-w %s\t%s" % (workers, 'same' if same else 'DIFFERENT')
+    if not same: failed = failed + 1
+    #an interrupted run (half of the input) continued on the whole input
+    half_file = os.path.join(work_dir, 'half.csv')
+    head(input_file, half_file, rows / 2 + 1)
+    resumed = os.path.join(work_dir, 'resumed.csv')
+    run_tool(['-i', half_file, '-o', resumed, '-w', str(workers)])
+    run_tool(['-i', input_file, '-o', resumed, '-w', str(workers), '--resume'])
+    same = read(resumed) == read(single)
+    print "--resume\t%s" % ('same' if same else 'DIFFERENT')
+    if not same: failed = failed + 1
+  finally:
+    server.shutdown()
+    shutil.rmtree(work_dir)
+  if failed:
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+# CheckExtractData: Compare abrcrawl.extract_data() with the quadratic version
+# it replaced, on the fixture gallery pages.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import re
+import sys
+import glob
+import getopt
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+import abrcrawl
+
+#CONSTANTS
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+#the small pages made for this check and the saved gallery pages
+FIXTURE_PATTERNS = ['extract_*.html', 'gallery_*.html']
+#the markers added before each entry of the crowded page, 1 and 2 digit days
+EXTRA_DAYS = ['5 de Janeiro de 2006', '17 de Março de 2006']
+
+def usage():
+  print """
+CheckExtractData
+http://github.com/fczuardi/abrcrawl
+
+Parse the fixture gallery pages (and a copy of them with several date
+markers between the entries) with abrcrawl.extract_data() and with the
+function it replaced, and check that both return the same photos. Both use
+the same abrcrawl.pt_to_iso_date(), only the parsing is compared.
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -f, --fixtures:\tThe directory with the extract_*.html and gallery_*.html pages (default bench/fixtures).
+"""
+
+"""abrcrawl.extract_data before the single pass parser: each entry is searched
+from the end of the previous one and the date marker from the start of the
+remaining text.
+"""
+def legacy_extract_data(html, date='unknown'):
+  photos = []
+  last_date = date
+  while 1:
+    image_entry_pattern = '<div id="lista_banco_imagens_bloco">.*?<a href="([^"]*)".*?<img src="([^"]*)".*?<div class="nomeFotografo">(.*?)</div>.*?<block align="left" class="legendafoto2">(.*?)</block>'
+    matches = re.search(image_entry_pattern, html, re.S|re.M)
+    if matches:
+      text_before_match = matches.string[:matches.start(0)]
+      date_mark_pattern = 'class="chapeu1".*?>(.*?)<'
+      last_date_mark_matches = re.search(date_mark_pattern, text_before_match, re.S|re.M)
+      if last_date_mark_matches:
+        last_date = last_date_mark_matches.group(1)
+      photos.append({
+        'thumbnail_url' : matches.group(2),
+        'author' : matches.group(3),
+        'description' : matches.group(4),
+        'pub_day' : abrcrawl.pt_to_iso_date(last_date),
+        'photo_page' : matches.group(1),
+      })
+      html = matches.string[matches.end(4):]
+    else: #no more matches
+      break
+  return photos
+
+"""A gallery page with several date markers before every entry.
+"""
+def crowded_page(html):
+  markers = ''.join(['<div class="dia"><span class="chapeu1">%s</span></div>\n' % day for day in EXTRA_DAYS])
+  return html.replace('<div id="lista_banco_imagens_bloco">', markers + '<div id="lista_banco_imagens_bloco">')
+
+def main():
+  fixtures_dir = FIXTURES_DIR
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hf:", ["help", "fixtures="])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-f", "--fixtures"):
+      fixtures_dir = a
+  pages = []
+  for pattern in FIXTURE_PATTERNS:
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, pattern))):
+      pages.append((os.path.basename(path), open(path, 'rb').read()))
+  if not pages:
+    print "No fixture pages in %s." % fixtures_dir
+    sys.exit(1)
+  pages.extend([('crowded %s' % name, crowded_page(html)) for name, html in pages])
+  failed = 0
+  for name, html in pages:
+    expected = legacy_extract_data(html)
+    photos = abrcrawl.extract_data(html)
+    if photos == expected and photos:
+      print "%s\t%s photos, same" % (name, len(photos))
+    else:
+      failed = failed + 1
+      print "%s\t%s photos, expected %s, DIFFERENT" % (name, len(photos), len(expected))
+  if failed:
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+# MakeImages: Create a directory of synthetic photos and the matching ABrCrawl
+# csv, to measure add_images_info.py without the real image archive.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import sys
+import csv
+import struct
+import random
+import getopt
+from PIL import Image
+
+#CONSTANTS
+AGENCIA_BRASIL_IMAGES_FOLDER = "http://www.agenciabrasil.gov.br/media/imagens/"
+OUTPUT_KEYS = ['pub_day', 'thumbnail_url', 'photo_page', 'description', 'author']
+DEFAULT_COUNT = 1000
+
+def usage():
+  print """
+MakeImages
+http://github.com/fczuardi/abrcrawl
+
+Write COUNT synthetic JPEG photos (most with Exif data, some missing or
+corrupted) to a directory and a csv listing them, in the format read by
+add_images_info.py.
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -d, --images-dir:\tThe directory where the photos are created.
+  -o, --output-file:\tThe csv file listing the photos.
+  -n, --count:\t\tThe number of photos (default %s).
+  --missing:\t\tThe fraction of photos listed in the csv but not created (default 0).
+  --corrupted:\t\tThe fraction of photos written truncated (default 0).
+  --seed:\t\tThe seed of the random sizes and contents (default 1).
+""" % DEFAULT_COUNT
+
+"""A minimal little endian Exif APP1 payload with ASCII tags of IFD0.
+"""
+def exif_bytes(tags):
+  entries = sorted(tags.items())
+  data_offset = 8 + 2 + 12 * len(entries) + 4
+  ifd = struct.pack('<H', len(entries))
+  data = ''
+  for tag, value in entries:
+    value = value + '\0'
+    if len(value) <= 4:
+      ifd = ifd + struct.pack('<HHL', tag, 2, len(value)) + value.ljust(4, '\0')
+    else:
+      ifd = ifd + struct.pack('<HHLL', tag, 2, len(value), data_offset + len(data))
+      data = data + value
+  ifd = ifd + struct.pack('<L', 0)
+  return 'Exif\0\0' + 'II' + struct.pack('<HL', 42, 8) + ifd + data
+
+"""Create the photos and the csv, returns the number of rows written.
+"""
+def make_images(images_dir, output_file, count=DEFAULT_COUNT, missing=0, corrupted=0, seed=1):
+  rng = random.Random(seed)
+  if not os.path.isdir(images_dir):
+    os.makedirs(images_dir)
+  writer = csv.writer(output_file, quoting=csv.QUOTE_ALL)
+  writer.writerow(OUTPUT_KEYS)
+  for i in range(count):
+    day = '2006/12/%02d' % (i % 31 + 1)
+    abr_filename = '%s/%sRP%04d.jpg' % (day, 1000 + i % 1300, i)
+    writer.writerow([day.replace('/', '-'), AGENCIA_BRASIL_IMAGES_FOLDER + abr_filename + '/image_miniatura', AGENCIA_BRASIL_IMAGES_FOLDER + abr_filename + '/view', 'Brasília - Foto sintética número %s.' % i, 'Fotógrafo %s/ABr' % (i % 20)])
+    dice = rng.random()
+    if dice < missing:
+      continue
+    path = os.path.join(images_dir, abr_filename.replace('/', '_'))
+    size = (rng.randint(320, 1024), rng.randint(240, 768))
+    img = Image.new('RGB', size, (i % 256, rng.randint(0, 255), 128))
+    if i % 4:
+      tags = {0x010F: 'Canon', 0x0110: 'Canon EOS 20D', 0x013B: 'Fotógrafo %s/ABr' % (i % 20), 0x0132: '2006:12:%02d 10:%02d:00' % (i % 31 + 1, i % 60)}
+      img.save(path, 'JPEG', quality=80, exif=exif_bytes(tags))
+    else:
+      img.save(path, 'JPEG', quality=80)
+    if dice < missing + corrupted:
+      f = open(path, 'r+b')
+      f.truncate(os.path.getsize(path) / 3)
+      f.close()
+  return count
+
+def main():
+  images_dir = None
+  output_file = None
+  count = DEFAULT_COUNT
+  missing = 0
+  corrupted = 0
+  seed = 1
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hd:o:n:", ["help", "images-dir=", "output-file=", "count=", "missing=", "corrupted=", "seed="])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-d", "--images-dir"):
+      images_dir = a
+    elif o in ("-o", "--output-file"):
+      output_file = file(a, "wb")
+    elif o in ("-n", "--count"):
+      count = int(a)
+    elif o == "--missing":
+      missing = float(a)
+    elif o == "--corrupted":
+      corrupted = float(a)
+    elif o == "--seed":
+      seed = int(a)
+    else:
+      assert False, "unhandled option"
+  if not images_dir or not output_file:
+    usage()
+    sys.exit(2)
+  make_images(images_dir, output_file, count, missing, corrupted, seed)
+  output_file.close()
+
+if __name__ == "__main__":
+  main()
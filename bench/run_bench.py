@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+# RunBench: Measure the parsers and the three ABrCrawl tools against the saved
+# fixture pages, the local stub server and synthetic images, and save the
+# numbers as JSON so that runs can be compared over time.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import sys
+import time
+import getopt
+import shutil
+import platform
+import resource
+import tempfile
+import subprocess
+import simplejson as json
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, ROOT_DIR)
+import abrcrawl
+import add_proper_dates
+import stub_server
+import make_images
+
+#CONSTANTS
+SUITES = ['parse', 'crawl', 'dates', 'images']
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+#the tools are run in a child process so that their peak memory is measured
+#alone, the gallery url is pointed to the stub server before calling main()
+LAUNCHER = """import sys
+sys.path.insert(0, %r)
+import %s as tool
+tool.AGENCIA_BRASIL_GALLERY_URL = %r
+sys.argv = sys.argv[1:]
+tool.main()
+"""
+
+verbose = False
+
+def usage():
+  print """
+RunBench
+http://github.com/fczuardi/abrcrawl
+
+Run the benchmark suites and save the results to a JSON file.
+
+Suites:
+  parse:\tParse time of extract_data() and extract_abr_date_string() over the fixture pages (us/page).
+  crawl:\tabrcrawl.py against the stub server (pages/s, rows/s, peak RSS).
+  dates:\tadd_proper_dates.py over the crawl output (pages/s, rows/s, peak RSS).
+  images:\tadd_images_info.py over a directory of synthetic photos (rows/s, peak RSS).
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -s, --suites:\t\tComma separated list of suites to run (default %s).
+  -p, --pages:\t\tThe number of gallery pages crawled (default 200).
+  -n, --images:\t\tThe number of synthetic photos (default 2000).
+  -r, --repeat:\t\tThe number of times each fixture page is parsed (default 2000).
+  -w, --workers:\tThe --workers passed to abrcrawl.py and add_proper_dates.py (default 4).
+  -j, --jobs:\t\tThe --jobs passed to add_images_info.py (default 1).
+  -l, --latency:\tMilliseconds the stub server waits before each answer (default 0).
+  -e, --error-rate:\tThe fraction of stub server answers that are 503 errors (default 0).
+  -o, --output-file:\tWhere to save the results (default bench/results/<date>.json).
+  -c, --compare:\tA previous results file to print the differences against.
+  -v, --verbose:\tPrint extra info while performing the tasks.
+""" % ','.join(SUITES)
+
+"""Peak resident memory of a rusage in kilobytes (macOS reports bytes).
+"""
+def peak_rss_kb(usage):
+  if sys.platform == 'darwin':
+    return usage.ru_maxrss / 1024
+  return usage.ru_maxrss
+
+"""Run one of the tools in a child process and return its wall time and
+peak RSS. stdout and stderr are discarded unless verbose.
+"""
+def run_tool(module, args, gallery_url=None):
+  script = LAUNCHER % (os.path.abspath(ROOT_DIR), module, gallery_url or abrcrawl.AGENCIA_BRASIL_GALLERY_URL)
+  command = [sys.executable, '-c', script, module + '.py'] + args
+  log(' '.join(command[3:]))
+  output = None if verbose else open(os.devnull, 'wb')
+  start = time.time()
+  child = subprocess.Popen(command, stdout=output, stderr=output)
+  pid, status, usage = os.wait4(child.pid, 0)
+  elapsed = time.time() - start
+  if output: output.close()
+  if status:
+    raise RuntimeError('%s exited with status %s' % (module, status))
+  return elapsed, peak_rss_kb(usage)
+
+def count_rows(path):
+  f = open(path, 'rb')
+  count = sum(1 for line in f) - 1
+  f.close()
+  return count
+
+"""Average parse time in microseconds of func over the pages.
+"""
+def time_parser(func, pages, repeat):
+  start = time.time()
+  for i in xrange(repeat):
+    for page in pages:
+      func(page)
+  return (time.time() - start) * 1000000 / (repeat * len(pages))
+
+def bench_parse(options, work_dir):
+  galleries, photos = stub_server.load_fixtures()
+  return {
+    'gallery_pages': len(galleries),
+    'gallery_us_per_page': round(time_parser(abrcrawl.extract_data, galleries, options['repeat']), 2),
+    'rows_per_page': sum(len(abrcrawl.extract_data(page)) for page in galleries) / float(len(galleries)),
+    'photo_pages': len(photos),
+    'photo_us_per_page': round(time_parser(add_proper_dates.extract_abr_date_string, photos, options['repeat']), 2),
+    'peak_rss_kb': peak_rss_kb(resource.getrusage(resource.RUSAGE_SELF)),
+  }
+
+def bench_crawl(options, work_dir, server):
+  output_file = os.path.join(work_dir, 'crawl.csv')
+  elapsed, rss = run_tool('abrcrawl', ['-p', str(options['pages']), '-w', str(options['workers']), '-o', output_file], server.gallery_url)
+  rows = count_rows(output_file)
+  return {
+    'pages': options['pages'],
+    'rows': rows,
+    'seconds': round(elapsed, 3),
+    'pages_per_second': round(options['pages'] / elapsed, 2),
+    'rows_per_second': round(rows / elapsed, 2),
+    'peak_rss_kb': rss,
+  }
+
+def bench_dates(options, work_dir, server):
+  input_file = os.path.join(work_dir, 'crawl.csv')
+  if not os.path.exists(input_file):
+    bench_crawl(options, work_dir, server)
+  output_file = os.path.join(work_dir, 'dates.csv')
+  pages = count_rows(input_file)
+  elapsed, rss = run_tool('add_proper_dates', ['-i', input_file, '-o', output_file, '-w', str(options['workers'])])
+  rows = count_rows(output_file)
+  return {
+    'pages': pages,
+    'rows': rows,
+    'seconds': round(elapsed, 3),
+    'pages_per_second': round(pages / elapsed, 2),
+    'rows_per_second': round(rows / elapsed, 2),
+    'peak_rss_kb': rss,
+  }
+
+def bench_images(options, work_dir, server):
+  images_dir = os.path.join(work_dir, 'images')
+  input_file = os.path.join(work_dir, 'images.csv')
+  output_file = os.path.join(work_dir, 'images_info.csv')
+  f = open(input_file, 'wb')
+  make_images.make_images(images_dir, f, options['images'], 0.01, 0.01)
+  f.close()
+  elapsed, rss = run_tool('add_images_info', ['-i', input_file, '-d', images_dir, '-o', output_file, '-j', str(options['jobs'])])
+  rows = count_rows(output_file)
+  return {
+    'images': options['images'],
+    'rows': rows,
+    'seconds': round(elapsed, 3),
+    'rows_per_second': round(rows / elapsed, 2),
+    'peak_rss_kb': rss,
+  }
+
+"""Print the numbers of the current results next to the ones of a previous run.
+"""
+def compare(previous, current):
+  for suite in SUITES:
+    if suite not in current['suites'] or suite not in previous['suites']: continue
+    print suite
+    for key, value in sorted(current['suites'][suite].items()):
+      old = previous['suites'][suite].get(key)
+      if old:
+        print "  %-22s %12s %12s %+8.1f%%" % (key, old, value, (value - old) * 100.0 / old)
+      else:
+        print "  %-22s %12s %12s" % (key, old, value)
+
+def git_revision():
+  try:
+    child = subprocess.Popen(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, stdout=subprocess.PIPE, stderr=open(os.devnull, 'wb'))
+    return child.communicate()[0].strip() or None
+  except OSError:
+    return None
+
+def main():
+  global verbose
+  suites = SUITES
+  output_file_name = None
+  compare_file_name = None
+  options = {'pages': 200, 'images': 2000, 'repeat': 2000, 'workers': 4, 'jobs': 1, 'latency': 0, 'error_rate': 0}
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hs:p:n:r:w:j:l:e:o:c:v", ["help", "suites=", "pages=", "images=", "repeat=", "workers=", "jobs=", "latency=", "error-rate=", "output-file=", "compare=", "verbose"])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-s", "--suites"):
+      suites = a.split(',')
+    elif o in ("-p", "--pages"):
+      options['pages'] = int(a)
+    elif o in ("-n", "--images"):
+      options['images'] = int(a)
+    elif o in ("-r", "--repeat"):
+      options['repeat'] = int(a)
+    elif o in ("-w", "--workers"):
+      options['workers'] = int(a)
+    elif o in ("-j", "--jobs"):
+      options['jobs'] = int(a)
+    elif o in ("-l", "--latency"):
+      options['latency'] = float(a)
+    elif o in ("-e", "--error-rate"):
+      options['error_rate'] = float(a)
+    elif o in ("-o", "--output-file"):
+      output_file_name = a
+    elif o in ("-c", "--compare"):
+      compare_file_name = a
+    elif o in ("-v", "--verbose"):
+      verbose = True
+    else:
+      assert False, "unhandled option"
+  for suite in suites:
+    if suite not in SUITES:
+      print "Unknown suite: %s" % suite
+      usage()
+      sys.exit(2)
+  if not output_file_name:
+    if not os.path.isdir(RESULTS_DIR):
+      os.makedirs(RESULTS_DIR)
+    output_file_name = os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S.json'))
+  results = {
+    'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'revision': git_revision(),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'options': options,
+    'suites': {},
+  }
+  server = stub_server.StubServer(0, options['latency'] / 1000, options['error_rate'])
+  server.start()
+  work_dir = tempfile.mkdtemp(prefix='abrcrawl-bench-')
+  try:
+    for suite in SUITES:
+      if suite not in suites: continue
+      log('Running the %s suite…' % suite)
+      if suite == 'parse':
+        results['suites'][suite] = bench_parse(options, work_dir)
+      else:
+        results['suites'][suite] = globals()['bench_' + suite](options, work_dir, server)
+      print suite, json.dumps(results['suites'][suite], sort_keys=True)
+  finally:
+    server.shutdown()
+    shutil.rmtree(work_dir)
+  results['stub_statuses'] = dict((str(k), v) for k, v in server.statuses.items())
+  f = open(output_file_name, 'wb')
+  json.dump(results, f, indent=2, sort_keys=True)
+  f.close()
+  print "Results saved to %s" % output_file_name
+  if compare_file_name:
+    compare(json.load(open(compare_file_name, 'rb')), results)
+
+def log(m):
+  if verbose:
+    print m
+
+if __name__ == "__main__":
+  main()
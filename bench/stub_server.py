@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+# StubServer: A local stand-in for the Agencia Brasil website that serves the
+# saved pages in bench/fixtures with configurable latency and error rates.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import sys
+import glob
+import time
+import random
+import getopt
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+#CONSTANTS
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ORIGINAL_HOST = 'http://www.agenciabrasil.gov.br'
+GALLERY_PATH = '/imagens/banco_de_imagens_view/lista'
+PAGE_SIZE = 15
+DEFAULT_PORT = 8080
+
+def usage():
+  print """
+StubServer
+http://github.com/fczuardi/abrcrawl
+
+Serve the saved gallery and photo pages of bench/fixtures as if they were the
+Agencia Brasil website. Links inside the pages point back to the stub server.
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -p, --port:\t\tThe port to listen on (default %s).
+  -l, --latency:\tMilliseconds to wait before answering each request (default 0).
+  -e, --error-rate:\tThe fraction of requests answered with a 503 error (default 0).
+  --retry-after:\tSeconds sent in the Retry-After header of the 503 errors (default none).
+  -f, --fixtures:\tThe directory with the gallery_*.html and photo_*.html pages (default bench/fixtures).
+""" % DEFAULT_PORT
+
+"""Read the gallery and photo pages of a fixtures directory, sorted by name.
+"""
+def load_fixtures(fixtures_dir=FIXTURES_DIR):
+  read = lambda path: open(path, 'rb').read()
+  galleries = [read(path) for path in sorted(glob.glob(os.path.join(fixtures_dir, 'gallery_*.html')))]
+  photos = [read(path) for path in sorted(glob.glob(os.path.join(fixtures_dir, 'photo_*.html')))]
+  return galleries, photos
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+  disable_nagle_algorithm = True
+
+  def do_GET(self):
+    server = self.server
+    if server.latency:
+      time.sleep(server.latency)
+    path, query = urlparse.urlsplit(self.path)[2:4]
+    body = None
+    if server.error_rate and server.random() < server.error_rate:
+      status = 503
+    elif path.endswith(GALLERY_PATH):
+      #the pagination offset picks the page, wrapping around the saved ones
+      #with new photo names on each round so that no photo is listed twice
+      page = int(urlparse.parse_qs(query).get('b_start:int', ['0'])[0]) / PAGE_SIZE
+      round, page = divmod(page, len(server.galleries))
+      status = 200
+      body = server.galleries[page]
+      if round:
+        body = body.replace('.jpg/', '-%s.jpg/' % round)
+    elif path.endswith('/view'):
+      status = 200
+      body = server.photos[sum(map(ord, path)) % len(server.photos)]
+    else:
+      status = 404
+    server.count(status)
+    body = (body or '').replace(ORIGINAL_HOST, server.base_url)
+    self.send_response(status)
+    if status == 503 and server.retry_after is not None:
+      self.send_header('Retry-After', str(server.retry_after))
+    self.send_header('Content-Type', 'text/html; charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+"""A threaded HTTP server for the fixture pages. latency is in seconds and
+error_rate is the fraction of requests that fail with 503, sent with a
+Retry-After header when retry_after is given. The number of answers by status
+code is kept in `statuses`.
+"""
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+  request_queue_size = 128
+
+  def __init__(self, port=0, latency=0, error_rate=0, fixtures_dir=FIXTURES_DIR, seed=None, retry_after=None):
+    BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), StubHandler)
+    self.latency = latency
+    self.error_rate = error_rate
+    self.retry_after = retry_after
+    self.galleries, self.photos = load_fixtures(fixtures_dir)
+    self.base_url = 'http://127.0.0.1:%s' % self.server_address[1]
+    self.gallery_url = self.base_url + GALLERY_PATH
+    self.lock = threading.Lock()
+    self.statuses = {}
+    self.random = random.Random(seed).random
+
+  def count(self, status):
+    self.lock.acquire()
+    try:
+      self.statuses[status] = self.statuses.get(status, 0) + 1
+    finally:
+      self.lock.release()
+
+  """Serve from a daemon thread, call shutdown() to stop.
+  """
+  def start(self):
+    thread = threading.Thread(target=self.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    return thread
+
+def main():
+  port = DEFAULT_PORT
+  latency = 0
+  error_rate = 0
+  fixtures_dir = FIXTURES_DIR
+  retry_after = None
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hp:l:e:f:", ["help", "port=", "latency=", "error-rate=", "fixtures=", "retry-after="])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-p", "--port"):
+      port = int(a)
+    elif o in ("-l", "--latency"):
+      latency = float(a) / 1000
+    elif o in ("-e", "--error-rate"):
+      error_rate = float(a)
+    elif o in ("-f", "--fixtures"):
+      fixtures_dir = a
+    elif o == "--retry-after":
+      retry_after = int(a)
+    else:
+      assert False, "unhandled option"
+  server = StubServer(port, latency, error_rate, fixtures_dir, retry_after=retry_after)
+  print "Serving %s gallery and %s photo pages, gallery at %s" % (len(server.galleries), len(server.photos), server.gallery_url)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+
+if __name__ == "__main__":
+  main()
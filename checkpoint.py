@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# Checkpoint: Append-only journal of the work already completed by the ABrCrawl
+# scripts, so an interrupted run can be resumed where it stopped.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import threading
+
+"""A journal is a text file with one completed key per line. Keys are
+appended and synced to disk as soon as the work they describe has been saved,
+a truncated last line (from a crash while writing it) is ignored on load.
+done() only knows the keys loaded when resuming: the keys marked during the
+current run are written to the journal for the next one and never change
+what the current run skips.
+"""
+class Checkpoint(object):
+  def __init__(self, path, resume=False):
+    self.path = path
+    self.completed = set()
+    self.lock = threading.Lock()
+    if resume and os.path.exists(path):
+      for line in open(path, 'rb'):
+        if line.endswith('\n'):
+          self.completed.add(line[:-1])
+    self.journal = open(path, 'ab' if resume else 'wb')
+
+  """True if a previous run completed the key.
+  """
+  def done(self, key):
+    return key in self.completed
+
+  def mark(self, key):
+    self.lock.acquire()
+    try:
+      self.journal.write('%s\n' % key)
+      self.journal.flush()
+      os.fsync(self.journal.fileno())
+    finally:
+      self.lock.release()
+
+  def close(self):
+    self.journal.close()
+
+"""The journal file used for a given output file.
+"""
+def journal_path(output_path):
+  return '%s.journal' % output_path
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+# ColumnArchive: A compact column oriented file format for the ABrCrawl tables,
+# read through mmap one column (or one range of days) at a time.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import sys
+import os
+import csv
+import mmap
+import array
+import struct
+import getopt
+import simplejson as json
+import output_writers
+
+#CONSTANTS
+MAGIC = 'ABRCOL1\n'
+ALIGNMENT = 8
+INT_MIN = -2 ** 31 + 1
+INT_MAX = 2 ** 31 - 1
+#the code stored for an empty value in the integer columns
+INT_EMPTY = -2 ** 31
+#columns with fewer distinct values than rows / DICTIONARY_RATIO are dictionary encoded
+DICTIONARY_RATIO = 2
+DAY_KEY = 'pub_day'
+BIG_ENDIAN = sys.byteorder == 'big'
+
+#GLOBAL FLAGS
+verbose = None
+
+def usage():
+  print """
+ColumnArchive
+http://github.com/fczuardi/abrcrawl
+
+Convert ABrCrawl csv files to a column archive and back, or read some
+columns and days of an archive.
+
+In the archive each column is stored on its own: integer columns (image
+dimensions and sizes) as 32 bit numbers, columns with few distinct values
+(pub_day, author, ...) as a sorted dictionary plus one code per row and long
+text (descriptions, urls) as offsets into a single blob. Converting back
+writes the same columns, in the same order, as the original csv.
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  --pack:\t\tConvert the --input-file csv to a column archive.
+  --unpack:\t\tConvert the --input-file archive to csv.
+  -i, --input-file:\tThe file to convert or to read.
+  -o, --output-file:\tWhere to save the result (default stdout).
+  -c, --columns:\tComma separated list of the columns to read (default all).
+  --from:\t\tOnly read the rows of this day (YYYY-MM-DD) or later.
+  --to:\t\t\tOnly read the rows of this day (YYYY-MM-DD) or earlier.
+  -f, --format:\t\tThe output format when reading. Available formats: %s
+  -v, --verbose:\tPrint extra info while performing the tasks.
+""" % ', '.join(output_writers.FORMATS)
+
+"""An array of unsigned or signed numbers from a list, stored little endian.
+"""
+def packed_array(typecode, values):
+  numbers = array.array(typecode, values)
+  if BIG_ENDIAN: numbers.byteswap()
+  return numbers.tostring()
+
+def unpacked_array(typecode, data):
+  numbers = array.array(typecode)
+  numbers.fromstring(data)
+  if BIG_ENDIAN: numbers.byteswap()
+  return numbers
+
+"""The smallest unsigned typecode holding numbers up to `largest`.
+"""
+def code_type(largest):
+  if largest < 2 ** 8: return 'B'
+  if largest < 2 ** 16: return 'H'
+  return 'I'
+
+def is_int(value):
+  if value == '': return True
+  try:
+    number = int(value)
+  except ValueError:
+    return False
+  return str(number) == value and INT_MIN <= number <= INT_MAX
+
+"""The parts (name, typecode, bytes) of a list of strings stored as offsets
+into a single blob. The prefix and suffix shared by all the strings (the
+site address and the /view ending on the url columns) are stored only once.
+"""
+def blob_parts(values, prefix=''):
+  common = os.path.commonprefix(values) if values else ''
+  ending = os.path.commonprefix([value[len(common):][::-1] for value in values])[::-1] if values else ''
+  offsets = [0]
+  for value in values:
+    offsets.append(offsets[-1] + len(value) - len(common) - len(ending))
+  data = ''.join([value[len(common):len(value) - len(ending)] for value in values])
+  return [(prefix + 'prefix', None, common), (prefix + 'suffix', None, ending), (prefix + 'offsets', 'I', packed_array('I', offsets)), (prefix + 'data', None, data)]
+
+"""Pick the encoding of a column and return it with its parts.
+"""
+def encode_column(values):
+  if any(values) and all(map(is_int, values)):
+    return 'int', [('values', 'i', packed_array('i', [int(value) if value != '' else INT_EMPTY for value in values]))]
+  distinct = sorted(set(values))
+  if len(distinct) * DICTIONARY_RATIO <= len(values):
+    codes = dict([(value, i) for i, value in enumerate(distinct)])
+    typecode = code_type(len(distinct))
+    return 'dictionary', [('codes', typecode, packed_array(typecode, [codes[value] for value in values]))] + blob_parts(distinct, 'dictionary_')
+  return 'blob', blob_parts(values)
+
+"""Write the rows (dicts) to output_file as a column archive, with the columns
+in the order of keys.
+"""
+def write_archive(rows, keys, output_file):
+  columns = dict([(key, []) for key in keys])
+  count = 0
+  for row in rows:
+    for key in keys:
+      value = row.get(key)
+      columns[key].append(value if value is not None else '')
+    count = count + 1
+  header = {'rows': count, 'columns': []}
+  blocks = []
+  offset = 0
+  for key in keys:
+    encoding, parts = encode_column(columns[key])
+    #release the strings of the column as soon as it is encoded
+    del columns[key]
+    column = {'name': key, 'encoding': encoding, 'parts': {}}
+    for name, typecode, data in parts:
+      padding = -len(data) % ALIGNMENT
+      column['parts'][name] = [offset, len(data), typecode]
+      blocks.append(data + '\0' * padding)
+      offset = offset + len(data) + padding
+    header['columns'].append(column)
+    log('%s: %s encoding, %s bytes.' % (key, encoding, sum([part[1] for part in column['parts'].values()])))
+  header = json.dumps(header)
+  header = header + ' ' * (-(len(MAGIC) + 4 + len(header)) % ALIGNMENT)
+  output_file.write(MAGIC + struct.pack('<I', len(header)) + header)
+  for block in blocks:
+    output_file.write(block)
+  return count
+
+"""A column archive opened through mmap. Nothing is decoded until a column is
+asked for, and then only that column.
+"""
+class ColumnArchive(object):
+  def __init__(self, path):
+    self.file = open(path, 'rb')
+    self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+    if self.map[:len(MAGIC)] != MAGIC:
+      self.close()
+      raise ValueError('%s is not a column archive' % path)
+    header_size = struct.unpack('<I', self.map[len(MAGIC):len(MAGIC) + 4])[0]
+    self.data_start = len(MAGIC) + 4 + header_size
+    header = json.loads(self.map[len(MAGIC) + 4:self.data_start])
+    self.rows = header['rows']
+    self.columns = dict([(str(column['name']), column) for column in header['columns']])
+    self.keys = [str(column['name']) for column in header['columns']]
+    self.dictionaries = {}
+
+  def part(self, name, part):
+    offset, size, typecode = self.columns[name]['parts'][part]
+    data = self.map[self.data_start + offset:self.data_start + offset + size]
+    if typecode:
+      return unpacked_array(str(typecode), data)
+    return data
+
+  def encoding(self, name):
+    return self.columns[name]['encoding']
+
+  def strings(self, name, prefix=''):
+    common = self.part(name, prefix + 'prefix')
+    ending = self.part(name, prefix + 'suffix')
+    offsets = self.part(name, prefix + 'offsets')
+    data = self.part(name, prefix + 'data')
+    return [common + data[offsets[i]:offsets[i + 1]] + ending for i in xrange(len(offsets) - 1)]
+
+  """The sorted distinct values of a dictionary encoded column.
+  """
+  def dictionary(self, name):
+    if name not in self.dictionaries:
+      self.dictionaries[name] = self.strings(name, 'dictionary_')
+    return self.dictionaries[name]
+
+  """The values of a column, as strings like in the csv file.
+  """
+  def column(self, name):
+    encoding = self.encoding(name)
+    if encoding == 'int':
+      return [str(value) if value != INT_EMPTY else '' for value in self.part(name, 'values')]
+    if encoding == 'dictionary':
+      dictionary = self.dictionary(name)
+      return [dictionary[code] for code in self.part(name, 'codes')]
+    return self.strings(name)
+
+  """The numbers of an integer column, None for the empty values.
+  """
+  def numbers(self, name):
+    if self.encoding(name) != 'int':
+      raise ValueError('%s is not an integer column' % name)
+    return [value if value != INT_EMPTY else None for value in self.part(name, 'values')]
+
+  """The positions of the rows whose pub_day is between first and last
+  (inclusive, either may be None). On a dictionary encoded column only the
+  codes are compared.
+  """
+  def day_range(self, first=None, last=None, key=DAY_KEY):
+    inside = lambda value: (first is None or value >= first) and (last is None or value <= last)
+    if self.encoding(key) != 'dictionary':
+      return [i for i, value in enumerate(self.column(key)) if inside(value)]
+    wanted = [code for code, value in enumerate(self.dictionary(key)) if inside(value)]
+    if not wanted: return []
+    #the dictionary is sorted, so the wanted codes are contiguous
+    low, high = wanted[0], wanted[-1]
+    return [i for i, code in enumerate(self.part(key, 'codes')) if low <= code <= high]
+
+  """Yield the rows (dicts with the selected columns) at the given positions,
+  all of them by default.
+  """
+  def select(self, names=None, positions=None):
+    names = names or self.keys
+    columns = [self.column(name) for name in names]
+    if positions is None:
+      positions = xrange(self.rows)
+    for i in positions:
+      yield dict([(name, column[i]) for name, column in zip(names, columns)])
+
+  def close(self):
+    self.map.close()
+    self.file.close()
+
+"""Convert a csv file to a column archive, keeping its column order.
+"""
+def pack(input_file, output_file):
+  reader = csv.DictReader(input_file)
+  return write_archive(reader, reader.fieldnames, output_file)
+
+"""Write the rows of an archive as csv, in the order of its columns, in the
+same layout as the ABrCrawl scripts (print_results) write it.
+"""
+def unpack(archive, output_file, names=None, positions=None):
+  writer = output_writers.CsvWriter(output_file, names or archive.keys)
+  writer.write_rows(archive.select(names, positions))
+  writer.close()
+
+def main():
+  global verbose
+  mode = 'select'
+  input_file_name = None
+  output_file = sys.stdout
+  names = None
+  first_day = None
+  last_day = None
+  results_format = 'csv'
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hi:o:c:f:v", ["help", "pack", "unpack", "input-file=", "output-file=", "columns=", "from=", "to=", "format=", "verbose"])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o == "--pack":
+      mode = 'pack'
+    elif o == "--unpack":
+      mode = 'unpack'
+    elif o in ("-i", "--input-file"):
+      input_file_name = a
+    elif o in ("-o", "--output-file"):
+      output_file = file(a, "wb")
+    elif o in ("-c", "--columns"):
+      names = a.split(',')
+    elif o == "--from":
+      first_day = a
+    elif o == "--to":
+      last_day = a
+    elif o in ("-f", "--format"):
+      results_format = a
+    elif o in ("-v", "--verbose"):
+      verbose = True
+    else:
+      assert False, "unhandled option"
+  if not input_file_name:
+    return usage()
+  if results_format not in output_writers.FORMATS:
+    print "Unknown output format: %s" % results_format
+    usage()
+    sys.exit(2)
+  if mode == 'pack':
+    input_file = open(input_file_name, 'rb')
+    count = pack(input_file, output_file)
+    input_file.close()
+    log('%s rows packed.' % count)
+    output_file.close()
+    return
+  archive = ColumnArchive(input_file_name)
+  if names:
+    for name in names:
+      if name not in archive.columns:
+        print "Unknown column: %s" % name
+        sys.exit(2)
+  positions = None
+  if first_day or last_day:
+    positions = archive.day_range(first_day, last_day)
+    log('%s rows between %s and %s.' % (len(positions), first_day or 'the start', last_day or 'the end'))
+  if mode == 'unpack' or results_format == 'csv':
+    unpack(archive, output_file, names, positions)
+  else:
+    writer = output_writers.open_writer(results_format, output_file, names or archive.keys)
+    writer.write_rows(archive.select(names, positions))
+    writer.close()
+  archive.close()
+  output_file.close()
+
+def log(m):
+  global verbose
+  if verbose: print >> sys.stderr, m
+
+if __name__ == "__main__":
+  main()
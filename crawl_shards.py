@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+# CrawlShards: Split a date span of Agencia Brasil's image bank in shards and
+# crawl them from a shared sqlite work queue, so several processes (or hosts
+# sharing a filesystem) can work on the same span at the same time.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import sys
+import os
+import getopt
+import time
+import socket
+import datetime
+import threading
+import sqlite3
+import abrcrawl
+import output_writers
+import photo_db
+
+#CONSTANTS
+DEFAULT_SHARD_DAYS = 7
+DEFAULT_MAX_PAGES = 1000
+LEASE_TIMEOUT = 60 * 60
+#a worker thread stops after this many shards in a row could not be downloaded
+MAX_SHARD_FAILURES = 10
+OUTPUT_FORMATS = output_writers.FORMATS + ['sqlite']
+
+#GLOBAL FLAGS
+verbose = None
+
+def usage():
+  print """
+CrawlShards
+http://github.com/fczuardi/abrcrawl
+
+Split a date span in non-overlapping shards and crawl them from a shared work
+queue. Start any number of workers (in several terminals or hosts) on the
+same queue file, then merge the results into one deduplicated table ordered
+by date (newest first).
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -q, --queue:\t\tThe sqlite file holding the shards and the crawled rows.
+  --init:\t\tAdd the shards of the span given by --from and --to to the queue.
+  --from:\t\tThe first day of the span in the YYYY/MM/DD format.
+  --to:\t\t\tThe last day of the span in the YYYY/MM/DD format.
+  --shard-days:\t\tThe number of days in each shard (default %s).
+  --max-pages:\t\tThe maximum number of pages crawled for a single shard (default %s).
+  -w, --workers:\tThe number of shards crawled at the same time by this process (default 1).
+  --status:\t\tPrint how many shards are pending, running and done.
+  --merge:\t\tWrite all the crawled rows to the --output-file.
+  -f, --format:\t\tThe merge output format. Available formats: %s
+  -i, --indent:\t\tIf output format can be pretty printed(json for example) use the number of white spaces to use as indent level.
+  -o, --output-file:\tSave the merged output to a given filename.
+  -v, --verbose:\tPrint extra info while performing the tasks.
+""" % (DEFAULT_SHARD_DAYS, DEFAULT_MAX_PAGES, ', '.join(OUTPUT_FORMATS))
+
+"""The shards and their rows, in a sqlite file. Each worker thread or process
+opens its own ShardQueue on the same file. A shard is leased to one worker at
+a time; leases older than LEASE_TIMEOUT (a worker that died) are handed out
+again. The rows of a shard are saved in the same transaction that marks it
+as done, so a shard is either fully stored or crawled again.
+"""
+class ShardQueue(object):
+  def __init__(self, path):
+    self.db = sqlite3.connect(path, timeout=120, isolation_level=None)
+    self.db.text_factory = str
+    self.db.execute('CREATE TABLE IF NOT EXISTS shards (id INTEGER PRIMARY KEY, start_date TEXT, end_date TEXT, status TEXT, owner TEXT, leased_at REAL, UNIQUE (start_date, end_date))')
+    self.db.execute('CREATE TABLE IF NOT EXISTS rows (photo_page TEXT PRIMARY KEY, pub_day TEXT, thumbnail_url TEXT, description TEXT, author TEXT, shard_end TEXT, seq INTEGER)')
+    self.db.execute('CREATE INDEX IF NOT EXISTS rows_order ON rows (pub_day, shard_end, seq)')
+
+  def add_span(self, first_day, last_day, shard_days):
+    count = 0
+    self.db.execute('BEGIN IMMEDIATE')
+    end = last_day
+    while end >= first_day:
+      start = max(first_day, end - datetime.timedelta(days=shard_days - 1))
+      cursor = self.db.execute("INSERT OR IGNORE INTO shards (start_date, end_date, status) VALUES (?, ?, 'pending')", (start.isoformat(), end.isoformat()))
+      count = count + cursor.rowcount
+      end = start - datetime.timedelta(days=1)
+    self.db.execute('COMMIT')
+    return count
+
+  """Lease the newest pending shard to owner, skipping the ids in exclude.
+  """
+  def claim(self, owner, exclude=[]):
+    exclude = list(exclude)
+    self.db.execute('BEGIN IMMEDIATE')
+    try:
+      found = self.db.execute("SELECT id, start_date, end_date FROM shards WHERE (status = 'pending' OR (status = 'running' AND leased_at < ?)) AND id NOT IN (%s) ORDER BY end_date DESC LIMIT 1" % ', '.join(['?'] * len(exclude)), [time.time() - LEASE_TIMEOUT] + exclude).fetchone()
+      if found:
+        self.db.execute("UPDATE shards SET status = 'running', owner = ?, leased_at = ? WHERE id = ?", (owner, time.time(), found[0]))
+      self.db.execute('COMMIT')
+    except:
+      self.db.execute('ROLLBACK')
+      raise
+    return found
+
+  def complete(self, shard_id, shard_end, rows):
+    self.db.execute('BEGIN IMMEDIATE')
+    try:
+      self.db.executemany('INSERT OR IGNORE INTO rows VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(row['photo_page'], row['pub_day'], row['thumbnail_url'], row['description'], row['author'], shard_end, seq) for seq, row in enumerate(rows)])
+      self.db.execute("UPDATE shards SET status = 'done' WHERE id = ?", (shard_id,))
+      self.db.execute('COMMIT')
+    except:
+      self.db.execute('ROLLBACK')
+      raise
+
+  def release(self, shard_id):
+    self.db.execute("UPDATE shards SET status = 'pending', owner = NULL WHERE id = ?", (shard_id,))
+
+  def status(self):
+    return dict(self.db.execute('SELECT status, COUNT(*) FROM shards GROUP BY status').fetchall())
+
+  """All the crawled rows, newest first, keeping the page order inside a day.
+  """
+  def rows(self):
+    cursor = self.db.execute('SELECT pub_day, thumbnail_url, photo_page, description, author FROM rows ORDER BY pub_day DESC, shard_end DESC, seq')
+    for values in cursor:
+      yield dict(zip(abrcrawl.OUTPUT_KEYS, values))
+
+  def close(self):
+    self.db.close()
+
+"""Crawl the gallery pages of one shard, from its last day backwards, until a
+page is empty or older than the first day. Returns the rows inside the shard,
+None if a page could not be downloaded or False if the last of max_pages
+pages was still inside the shard (the rows would be incomplete).
+"""
+def crawl_shard(start_date, end_date, max_pages):
+  rows = []
+  last_day = end_date
+  for page_num in range(1, max_pages + 1):
+    content = abrcrawl.get_page(page_num, end_date.replace('-', '/'))
+    if content is False:
+      return None
+    #a page may start with photos of the last day listed in the previous one
+    photos = abrcrawl.extract_data(content, last_day)
+    if photos: last_day = photos[-1]['pub_day']
+    rows.extend([photo for photo in photos if start_date <= photo['pub_day'] <= end_date])
+    if not photos or photos[-1]['pub_day'] < start_date:
+      break
+  else:
+    return False
+  return rows
+
+"""Crawl shards until the queue is empty. Shards that failed are released and
+claimed again after a backoff; shards with more than max_pages pages are left
+pending (and added to too_large, shared by the threads of this process).
+"""
+def work(queue_path, max_pages, too_large):
+  queue = ShardQueue(queue_path)
+  owner = '%s:%s:%s' % (socket.gethostname(), os.getpid(), threading.currentThread().getName())
+  failures = 0
+  while True:
+    shard = queue.claim(owner, too_large)
+    if not shard: break
+    shard_id, start_date, end_date = shard
+    log('Crawling shard %s to %s.' % (start_date, end_date))
+    rows = crawl_shard(start_date, end_date, max_pages)
+    if rows is False:
+      log('Shard %s to %s has more than %s pages, it was left pending.' % (start_date, end_date, max_pages))
+      too_large.add(shard_id)
+      queue.release(shard_id)
+      continue
+    if rows is None:
+      queue.release(shard_id)
+      failures = failures + 1
+      if failures >= MAX_SHARD_FAILURES:
+        log('%s shards failed in a row, stopping this worker.' % failures)
+        break
+      log('Shard %s to %s failed, it will be crawled again.' % (start_date, end_date))
+      time.sleep(abrcrawl.request_scheduler.delay(failures))
+      continue
+    failures = 0
+    queue.complete(shard_id, end_date, rows)
+    log('Shard %s to %s done, %s photos.' % (start_date, end_date, len(rows)))
+  queue.close()
+
+def parse_day(value):
+  return datetime.datetime.strptime(value, '%Y/%m/%d').date()
+
+def main():
+  global verbose
+  queue_path = None
+  init = False
+  first_day = None
+  last_day = None
+  shard_days = DEFAULT_SHARD_DAYS
+  max_pages = DEFAULT_MAX_PAGES
+  workers = 1
+  show_status = False
+  merge = False
+  results_format = 'csv'
+  indent_level = None
+  output_file_name = None
+  if(len(sys.argv) < 2):
+    return usage()
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hq:w:f:i:o:v", ["help", "queue=", "init", "from=", "to=", "shard-days=", "max-pages=", "workers=", "status", "merge", "format=", "indent=", "output-file=", "verbose"])
+  except getopt.GetoptError, err:
+    # print help information and exit:
+    print str(err) # will print something like "option -a not recognized"
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-q", "--queue"):
+      queue_path = a
+    elif o == "--init":
+      init = True
+    elif o == "--from":
+      first_day = parse_day(a)
+    elif o == "--to":
+      last_day = parse_day(a)
+    elif o == "--shard-days":
+      shard_days = int(a)
+    elif o == "--max-pages":
+      max_pages = int(a)
+    elif o in ("-w", "--workers"):
+      workers = int(a)
+    elif o == "--status":
+      show_status = True
+    elif o == "--merge":
+      merge = True
+    elif o in ("-f", "--format"):
+      results_format = a
+    elif o in ("-i", "--indent"):
+      indent_level = int(a)
+    elif o in ("-o", "--output-file"):
+      output_file_name = a
+    elif o in ("-v", "--verbose"):
+      verbose = True
+    else:
+      assert False, "unhandled option"
+  if not queue_path:
+    print "A --queue file is required."
+    sys.exit(2)
+  abrcrawl.verbose = verbose
+  queue = ShardQueue(queue_path)
+  if init:
+    if not (first_day and last_day):
+      print "The --init option requires --from and --to."
+      sys.exit(2)
+    log('%s shards added.' % queue.add_span(first_day, last_day, shard_days))
+  elif show_status:
+    print queue.status()
+  elif merge:
+    if results_format not in OUTPUT_FORMATS:
+      print "Unknown output format: %s" % results_format
+      usage()
+      sys.exit(2)
+    if results_format == 'sqlite':
+      if not output_file_name:
+        print "The sqlite format requires an --output-file."
+        sys.exit(2)
+      output_file = photo_db.PhotoDatabase(output_file_name)
+      writer = output_file.writer(photo_db.WRITE_BATCH_SIZE)
+    else:
+      output_file = file( output_file_name, "wb" ) if output_file_name else sys.stdout
+      writer = output_writers.open_writer(results_format, output_file, abrcrawl.OUTPUT_KEYS, indent_level)
+    batch = []
+    for row in queue.rows():
+      batch.append(row)
+      if len(batch) >= photo_db.WRITE_BATCH_SIZE:
+        writer.write_rows(batch)
+        batch = []
+    writer.write_rows(batch)
+    writer.close()
+    output_file.close()
+  else:
+    abrcrawl.request_scheduler = abrcrawl.scheduler.RequestScheduler(abrcrawl.DEFAULT_HOST_CONNECTIONS)
+    too_large = set()
+    threads = [threading.Thread(target=work, args=(queue_path, max_pages, too_large)) for i in range(workers)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    if too_large:
+      print "%s shards have more than %s pages and were left pending, crawl them again with a larger --max-pages." % (len(too_large), max_pages)
+    log(queue.status())
+  queue.close()
+
+def log(m):
+  global verbose
+  if verbose: print(m)
+  
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# Dedup: Detect repeated rows in the tables produced by the ABrCrawl scripts
+# using hashed row fingerprints, kept in memory or in an on-disk set.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import hashlib
+import sqlite3
+
+#CONSTANTS
+DEDUP_KEYS = ['row', 'photo_page']
+DISK_BATCH_SIZE = 1000
+
+def normalize(value):
+  if value is None: return ''
+  return str(value).strip()
+
+"""A short digest identifying a row. With key 'row' every column takes part
+(in a fixed order, with surrounding white space removed), otherwise only the
+given column is used.
+"""
+def row_fingerprint(row, key='row'):
+  if key == 'row':
+    value = '\x1f'.join(['%s=%s' % (k, normalize(row[k])) for k in sorted(row.keys())])
+  else:
+    value = normalize(row.get(key))
+  return hashlib.sha1(value).digest()
+
+"""The fingerprints seen so far, with the input line where each one appeared
+first. add() returns None for a new fingerprint, or that first line.
+"""
+class SeenSet(object):
+  def __init__(self):
+    self.seen = {}
+
+  def add(self, fingerprint, line=0):
+    first_line = self.seen.get(fingerprint)
+    if first_line is not None:
+      return first_line
+    self.seen[fingerprint] = line
+    return None
+
+  def close(self):
+    self.seen = {}
+
+"""Same as SeenSet, but the fingerprints are kept in a sqlite file so memory
+use stays flat no matter how large the input is.
+"""
+class DiskSeenSet(object):
+  def __init__(self, path):
+    #the rows may be read by a different thread (the one feeding a process pool)
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.execute('CREATE TABLE IF NOT EXISTS seen (fingerprint BLOB PRIMARY KEY, line INTEGER)')
+    self.db.execute('DELETE FROM seen')
+    self.pending = 0
+
+  def add(self, fingerprint, line=0):
+    fingerprint = buffer(fingerprint)
+    found = self.db.execute('SELECT line FROM seen WHERE fingerprint = ?', (fingerprint,)).fetchone()
+    if found:
+      return found[0]
+    self.db.execute('INSERT INTO seen VALUES (?, ?)', (fingerprint, line))
+    #commit in batches, one transaction per insert would be too slow
+    self.pending = self.pending + 1
+    if self.pending >= DISK_BATCH_SIZE:
+      self.db.commit()
+      self.pending = 0
+    return None
+
+  def close(self):
+    self.db.commit()
+    self.db.close()
+
+"""Return the seen set for the selected memory mode.
+"""
+def open_seen_set(path=None):
+  if path:
+    return DiskSeenSet(path)
+  return SeenSet()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+# HTTPCache: Persistent on-disk cache for the pages downloaded by the ABrCrawl
+# scripts, with size bounded LRU eviction and ETag/Last-Modified revalidation.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import time
+import threading
+import hashlib
+import urllib2
+import simplejson as json
+import http_client
+import stats
+
+#CONSTANTS
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+BODY_SUFFIX = '.body'
+META_SUFFIX = '.meta'
+
+"""Load a url, going through the response cache when one is given.
+"""
+def fetch(url, cache=None):
+  if cache:
+    return cache.fetch(url)
+  return http_client.default_client.get(url)
+
+"""The suffix of the temporary files written before renaming them over a cache
+entry, named after the process and thread so concurrent runs sharing the
+cache never write the same file.
+"""
+def temp_suffix():
+  return '.%s.%s.tmp' % (os.getpid(), threading.currentThread().getName())
+
+"""Keep the body of each response in cache_dir, in a file named after the
+sha1 of its url, next to a small json file with the validators sent by the
+server. Entries younger than max_age seconds are served without touching the
+network, older ones are revalidated with a conditional request. When the
+cache grows past max_size bytes the least recently used entries are removed.
+In offline mode only cached entries are served, regardless of their age.
+"""
+class ResponseCache(object):
+  def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE, max_age=0, offline=False, client=None):
+    self.cache_dir = cache_dir
+    self.client = client or http_client.default_client
+    self.max_size = max_size
+    self.max_age = max_age
+    self.offline = offline
+    self.lock = threading.Lock()
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+    self.size = sum([size for mtime, size, path in self.entries()])
+
+  def path(self, url):
+    key = hashlib.sha1(url).hexdigest()
+    return os.path.join(self.cache_dir, key[:2], key)
+
+  def entries(self):
+    for root, dirs, files in os.walk(self.cache_dir):
+      for name in files:
+        if not name.endswith(BODY_SUFFIX): continue
+        path = os.path.join(root, name[:-len(BODY_SUFFIX)])
+        try:
+          stat = os.stat(path + BODY_SUFFIX)
+        except OSError:
+          continue
+        yield (stat.st_mtime, stat.st_size, path)
+
+  def load(self, url):
+    path = self.path(url)
+    try:
+      meta = json.load(open(path + META_SUFFIX, 'rb'))
+      body = open(path + BODY_SUFFIX, 'rb').read()
+    except (IOError, ValueError):
+      return None, None
+    #mark the entry as recently used
+    try:
+      os.utime(path + BODY_SUFFIX, None)
+    except OSError:
+      pass
+    return meta, body
+
+  def store(self, url, meta, body):
+    path = self.path(url)
+    if not os.path.isdir(os.path.dirname(path)):
+      try:
+        os.makedirs(os.path.dirname(path))
+      except OSError:
+        pass
+    try:
+      old_size = os.path.getsize(path + BODY_SUFFIX)
+    except OSError:
+      old_size = 0
+    #write to temporary files first so readers never see partial entries
+    suffix = temp_suffix()
+    f = open(path + BODY_SUFFIX + suffix, 'wb')
+    f.write(body)
+    f.close()
+    f = open(path + META_SUFFIX + suffix, 'wb')
+    json.dump(meta, f)
+    f.close()
+    os.rename(path + BODY_SUFFIX + suffix, path + BODY_SUFFIX)
+    os.rename(path + META_SUFFIX + suffix, path + META_SUFFIX)
+    self.lock.acquire()
+    try:
+      self.size = self.size + len(body) - old_size
+      if self.size > self.max_size:
+        self.evict()
+    finally:
+      self.lock.release()
+
+  def touch(self, url, meta):
+    path = self.path(url)
+    suffix = temp_suffix()
+    f = open(path + META_SUFFIX + suffix, 'wb')
+    json.dump(meta, f)
+    f.close()
+    os.rename(path + META_SUFFIX + suffix, path + META_SUFFIX)
+
+  def evict(self):
+    entries = sorted(self.entries())
+    target = self.max_size * 0.9
+    for mtime, size, path in entries:
+      if self.size <= target: break
+      for suffix in (BODY_SUFFIX, META_SUFFIX):
+        try:
+          os.remove(path + suffix)
+        except OSError:
+          pass
+      self.size = self.size - size
+
+  def fetch(self, url):
+    meta, body = self.load(url)
+    if meta is not None:
+      if self.offline or time.time() - meta.get('stored_at', 0) < self.max_age:
+        stats.default_stats.count('cache.hit')
+        return body
+    elif self.offline:
+      stats.default_stats.count('cache.miss')
+      raise urllib2.URLError('%s is not in the cache (offline mode)' % url)
+    headers = {}
+    if meta is not None:
+      if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+      if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    try:
+      response = self.client.request(url, headers)
+    except urllib2.HTTPError, e:
+      if e.code == 304 and meta is not None:
+        meta['stored_at'] = time.time()
+        self.touch(url, meta)
+        stats.default_stats.count('cache.revalidated')
+        return body
+      raise
+    stats.default_stats.count('cache.miss')
+    body = response.read()
+    headers = response.info()
+    self.store(url, {
+      'url': url,
+      'etag': headers.getheader('ETag'),
+      'last_modified': headers.getheader('Last-Modified'),
+      'stored_at': time.time(),
+    }, body)
+    return body
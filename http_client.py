@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+# HTTPClient: Shared HTTP client for the ABrCrawl scripts. Keeps persistent
+# (keep-alive) connections to each host, accepts compressed responses and
+# reports errors with the same exceptions urllib2 uses.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import time
+import socket
+import threading
+import httplib
+import urllib2
+import urlparse
+import zlib
+import StringIO
+import stats
+
+#CONSTANTS
+DEFAULT_TIMEOUT = 30
+MAX_REDIRECTS = 5
+MAX_IDLE_CONNECTIONS = 8
+USER_AGENT = 'ABrCrawl/0.1 (+http://github.com/fczuardi/abrcrawl)'
+
+"""A fully read response. headers is a mimetools.Message like urllib2 uses.
+"""
+class Response(object):
+  def __init__(self, url, status, reason, headers, body):
+    self.url = url
+    self.status = status
+    self.reason = reason
+    self.headers = headers
+    self.body = body
+
+  def info(self):
+    return self.headers
+
+  def read(self):
+    return self.body
+
+"""A response being read from its connection. The connection goes back to the
+client once the whole body was read, closing earlier drops it.
+"""
+class StreamResponse(object):
+  def __init__(self, client, url, connection, response):
+    self.client = client
+    self.url = url
+    self.connection = connection
+    self.response = response
+    self.status = response.status
+    self.headers = response.msg
+    self.done = False
+
+  def getheader(self, name, default=None):
+    return self.response.getheader(name, default)
+
+  def read(self, size):
+    try:
+      data = self.response.read(size)
+    except (httplib.HTTPException, socket.error), e:
+      self.close()
+      stats.default_stats.count('http.errors')
+      raise urllib2.URLError(e)
+    stats.default_stats.count('http.bytes', len(data))
+    if not data and not self.done:
+      self.done = True
+      self.client.finish(self.url, self.connection, self.response)
+    return data
+
+  def close(self):
+    if not self.done:
+      self.done = True
+      self.connection.close()
+
+"""Undo the gzip or deflate content encoding of a response body.
+"""
+def decode_body(body, encoding):
+  encoding = (encoding or '').strip().lower()
+  if encoding in ('gzip', 'x-gzip'):
+    return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+  elif encoding == 'deflate':
+    #some servers send a raw deflate stream instead of the zlib format
+    try:
+      return zlib.decompress(body)
+    except zlib.error:
+      return zlib.decompress(body, -zlib.MAX_WBITS)
+  return body
+
+"""Keep idle connections per (scheme, host) and hand them out to one request
+at a time, so it can be shared by several worker threads.
+"""
+class HTTPClient(object):
+  def __init__(self, timeout=DEFAULT_TIMEOUT, max_idle=MAX_IDLE_CONNECTIONS):
+    self.timeout = timeout
+    self.max_idle = max_idle
+    self.lock = threading.Lock()
+    self.idle = {}
+
+  def connect(self, scheme, host):
+    if scheme == 'https':
+      return httplib.HTTPSConnection(host, timeout=self.timeout)
+    return httplib.HTTPConnection(host, timeout=self.timeout)
+
+  def checkout(self, scheme, host):
+    self.lock.acquire()
+    try:
+      connections = self.idle.get((scheme, host))
+      if connections:
+        return connections.pop(), True
+    finally:
+      self.lock.release()
+    return self.connect(scheme, host), False
+
+  def checkin(self, scheme, host, connection):
+    self.lock.acquire()
+    try:
+      connections = self.idle.setdefault((scheme, host), [])
+      if len(connections) < self.max_idle:
+        connections.append(connection)
+        return
+    finally:
+      self.lock.release()
+    connection.close()
+
+  def close(self):
+    self.lock.acquire()
+    try:
+      for connections in self.idle.values():
+        for connection in connections:
+          connection.close()
+      self.idle = {}
+    finally:
+      self.lock.release()
+
+  """Send a GET request and wait for the response headers. Returns the
+  connection and the httplib response, the body is left to be read.
+  """
+  def start(self, url, headers):
+    scheme, host, path, query, fragment = urlparse.urlsplit(url)
+    if query: path = '%s?%s' % (path, query)
+    request_headers = {
+      'User-Agent': USER_AGENT,
+      'Accept-Encoding': 'gzip, deflate',
+    }
+    request_headers.update(headers or {})
+    while True:
+      connection, reused = self.checkout(scheme, host)
+      try:
+        connection.request('GET', path or '/', headers=request_headers)
+        response = connection.getresponse()
+      except (httplib.HTTPException, socket.error), e:
+        connection.close()
+        #the server may have closed an idle connection, try once more on a new one
+        if reused: continue
+        stats.default_stats.count('http.errors')
+        if isinstance(e, socket.timeout):
+          raise urllib2.URLError('timed out')
+        raise urllib2.URLError(e)
+      stats.default_stats.count('http.status.%s' % response.status)
+      return connection, response
+
+  """Give back the connection of a response whose body was fully read.
+  """
+  def finish(self, url, connection, response):
+    scheme, host = urlparse.urlsplit(url)[:2]
+    if response.will_close:
+      connection.close()
+    else:
+      self.checkin(scheme, host, connection)
+
+  def send(self, url, headers):
+    started = time.time()
+    connection, response = self.start(url, headers)
+    try:
+      body = response.read()
+    except (httplib.HTTPException, socket.error), e:
+      connection.close()
+      stats.default_stats.count('http.errors')
+      raise urllib2.URLError(e)
+    self.finish(url, connection, response)
+    stats.default_stats.observe('http.fetch', time.time() - started)
+    stats.default_stats.count('http.bytes', len(body))
+    return response, body
+
+  """Send a GET request and return a StreamResponse to read the body in chunks,
+  as it arrives. The body is not decoded, so ask for the identity encoding
+  when that matters (Range requests, for example).
+  """
+  def open(self, url, headers=None):
+    for i in range(MAX_REDIRECTS + 1):
+      connection, response = self.start(url, headers)
+      if response.status in (301, 302, 303, 307) and response.getheader('Location'):
+        response.read()
+        self.finish(url, connection, response)
+        url = urlparse.urljoin(url, response.getheader('Location'))
+        continue
+      break
+    if response.status >= 300:
+      body = response.read()
+      self.finish(url, connection, response)
+      raise urllib2.HTTPError(url, response.status, response.reason, response.msg, StringIO.StringIO(body))
+    return StreamResponse(self, url, connection, response)
+
+  """Send a GET request and return the Response. Redirects are followed and
+  errors are raised as urllib2.HTTPError/urllib2.URLError, like urlopen does.
+  """
+  def request(self, url, headers=None):
+    for i in range(MAX_REDIRECTS + 1):
+      response, body = self.send(url, headers)
+      if response.status in (301, 302, 303, 307) and response.getheader('Location'):
+        url = urlparse.urljoin(url, response.getheader('Location'))
+        continue
+      break
+    if response.status >= 300:
+      raise urllib2.HTTPError(url, response.status, response.reason, response.msg, StringIO.StringIO(body))
+    try:
+      body = decode_body(body, response.getheader('Content-Encoding'))
+    except zlib.error, e:
+      raise urllib2.URLError('could not decode the response: %s' % e)
+    return Response(url, response.status, response.reason, response.msg, body)
+
+  def get(self, url, headers=None):
+    return self.request(url, headers).body
+
+#the client shared by all the scripts
+default_client = HTTPClient()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# ImageDownload: Download image files concurrently, in chunks, resuming partial
+# downloads and checking each file before moving it into place.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import os
+import urllib2
+import http_client
+import workerpool
+import scheduler
+from PIL import Image
+
+#CONSTANTS
+CHUNK_SIZE = 64 * 1024
+PART_SUFFIX = '.part'
+DEFAULT_WORKERS = 4
+
+"""Download url to path. The data goes to path.part first; when that file
+already exists (an interrupted download) only the missing bytes are asked
+for with a Range request. The image is opened and verified with PIL before
+being renamed to path. Transient errors are retried by the scheduler, each
+attempt resuming where the last one stopped. Returns True on success.
+"""
+def download(url, path, client=None, request_scheduler=None):
+  client = client or http_client.default_client
+  part_path = path + PART_SUFFIX
+  def transfer(url):
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {'Accept-Encoding': 'identity'}
+    if offset:
+      headers['Range'] = 'bytes=%s-' % offset
+    try:
+      response = client.open(url, headers)
+    except urllib2.HTTPError, e:
+      #the partial file already holds the whole image
+      if e.code != 416 or not offset: raise
+      return
+    #the server ignored the range, start over
+    if offset and response.status != 206:
+      offset = 0
+    output = open(part_path, 'ab' if offset else 'wb')
+    try:
+      while True:
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk: break
+        output.write(chunk)
+    finally:
+      output.close()
+      response.close()
+  try:
+    if request_scheduler:
+      request_scheduler.call(url, transfer)
+    else:
+      transfer(url)
+  except urllib2.URLError, e:
+    return False
+  if not verify_image(part_path):
+    os.remove(part_path)
+    return False
+  os.rename(part_path, path)
+  return True
+
+def verify_image(path):
+  try:
+    Image.open(path).verify()
+  except Exception:
+    return False
+  return True
+
+"""Download a list of (url, path) pairs with a pool of worker threads, at most
+host_connections at a time from the same host. Yields (url, path, success)
+in the same order as the list.
+"""
+def download_all(downloads, workers=DEFAULT_WORKERS, host_connections=DEFAULT_WORKERS, retries=scheduler.DEFAULT_RETRIES):
+  request_scheduler = scheduler.RequestScheduler(host_connections, retries)
+  def fetch(item):
+    url, path = item
+    return url, path, download(url, path, request_scheduler=request_scheduler)
+  return workerpool.ordered_map(fetch, downloads, workers)
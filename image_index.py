@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# ImageIndex: Persistent index of the info read from local image files, so
+# AddImagesInfo only opens the files that are new or changed since its last run.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import sqlite3
+import threading
+
+#CONSTANTS
+INFO_KEYS = [
+  'photo_format',
+  'photo_orientation',
+  'photo_width',
+  'photo_height',
+  'photo_size',
+  'exif_artist',
+  'exif_flash',
+  'exif_date_time_original',
+  'exif_make',
+  'exif_model',
+  'exif_software'
+]
+COMMIT_BATCH_SIZE = 500
+
+"""A sqlite table with one row per local file name. An entry is only used when
+the size and modification time of the file are still the ones recorded with
+it. The status ('ok' or 'corrupted') is kept too, so broken files are not
+opened again until they change.
+"""
+class ImageIndex(object):
+  def __init__(self, path):
+    #lookups may come from the thread feeding a process pool
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.text_factory = str
+    self.lock = threading.Lock()
+    self.db.execute('CREATE TABLE IF NOT EXISTS images (filename TEXT PRIMARY KEY, size INTEGER, mtime REAL, status TEXT, %s)' % ', '.join(INFO_KEYS))
+    self.pending = 0
+    self.hits = 0
+    self.misses = 0
+
+  def lookup(self, filename, size, mtime):
+    self.lock.acquire()
+    try:
+      found = self.db.execute('SELECT status, %s FROM images WHERE filename = ? AND size = ? AND mtime = ?' % ', '.join(INFO_KEYS), (filename, size, mtime)).fetchone()
+    finally:
+      self.lock.release()
+    if not found:
+      self.misses = self.misses + 1
+      return None
+    self.hits = self.hits + 1
+    status = found[0]
+    if status != 'ok':
+      return status, None
+    info = {}
+    for key, value in zip(INFO_KEYS, found[1:]):
+      info[key] = value if value is not None else ''
+    return status, info
+
+  def store(self, filename, size, mtime, status, info):
+    values = [(info or {}).get(key) for key in INFO_KEYS]
+    self.lock.acquire()
+    try:
+      self.db.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, %s)' % ', '.join(['?'] * len(INFO_KEYS)), [filename, size, mtime, status] + values)
+      self.pending = self.pending + 1
+      if self.pending >= COMMIT_BATCH_SIZE:
+        self.db.commit()
+        self.pending = 0
+    finally:
+      self.lock.release()
+
+  def close(self):
+    self.db.commit()
+    self.db.close()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# ImageProbe: Read the dimensions and a few EXIF tags of JPEG files straight
+# from their headers, without decoding the image or every EXIF tag.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import struct
+
+#CONSTANTS
+#EXIF tags read from the main image directory (IFD0) and the EXIF directory
+IFD0_TAGS = {
+  0x010F: 'Make',
+  0x0110: 'Model',
+  0x0131: 'Software',
+  0x013B: 'Artist',
+}
+EXIF_TAGS = {
+  0x9003: 'DateTimeOriginal',
+  0x9209: 'Flash',
+}
+EXIF_IFD_POINTER = 0x8769
+#size in bytes of the TIFF field types used by the wanted tags (byte, ascii,
+#short, long, undefined) and the struct format of the numeric ones
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 7: 1}
+NUMBER_FORMATS = {1: 'B', 3: 'H', 4: 'L'}
+#start of frame markers, they carry the image dimensions
+SOF_MARKERS = [0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF]
+SOS_MARKER = 0xDA
+APP1_MARKER = 0xE1
+
+class ProbeError(Exception):
+  pass
+
+"""Walk the JPEG segments up to the start of the scan, reading only the segment
+headers, the frame header and the EXIF (APP1) segment. Returns (width, height,
+tags) where tags maps the wanted EXIF tag names to their values as strings,
+or None if the file is not a JPEG. Raises ProbeError on malformed files.
+"""
+def probe_jpeg(path):
+  f = open(path, 'rb')
+  try:
+    if f.read(2) != '\xff\xd8':
+      return None
+    size = None
+    tags = {}
+    exif_read = False
+    while True:
+      byte = f.read(1)
+      if byte != '\xff':
+        raise ProbeError('expected a marker')
+      #markers may be padded with any number of 0xff bytes
+      while byte == '\xff':
+        byte = f.read(1)
+      if not byte:
+        raise ProbeError('unexpected end of file')
+      marker = ord(byte)
+      if marker == SOS_MARKER:
+        break
+      #markers without a payload
+      if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+        continue
+      header = f.read(2)
+      if len(header) < 2:
+        raise ProbeError('unexpected end of file')
+      length = struct.unpack('>H', header)[0] - 2
+      if marker in SOF_MARKERS:
+        frame = f.read(length)
+        if len(frame) < 5:
+          raise ProbeError('truncated frame header')
+        height, width = struct.unpack('>HH', frame[1:5])
+        size = (width, height)
+      elif marker == APP1_MARKER and not exif_read:
+        segment = f.read(length)
+        if segment[:6] == 'Exif\x00\x00':
+          exif_read = True
+          try:
+            tags = read_exif(segment[6:])
+          except (struct.error, IndexError, ValueError):
+            tags = {}
+      else:
+        f.seek(length, 1)
+    if size is None:
+      raise ProbeError('no frame header')
+    return size[0], size[1], tags
+  finally:
+    f.close()
+
+"""Decode the wanted tags of a TIFF structure (the payload of an EXIF segment).
+"""
+def read_exif(data):
+  if data[:2] == 'II':
+    order = '<'
+  elif data[:2] == 'MM':
+    order = '>'
+  else:
+    raise ValueError('unknown byte order')
+  ifd0_offset = struct.unpack(order + 'L', data[4:8])[0]
+  tags = {}
+  exif_offset = read_ifd(data, ifd0_offset, order, IFD0_TAGS, tags)
+  if exif_offset:
+    read_ifd(data, exif_offset, order, EXIF_TAGS, tags)
+  return tags
+
+"""Read the entries of one image file directory whose tag ids are in wanted.
+Returns the offset of the EXIF directory if this one points to it.
+"""
+def read_ifd(data, offset, order, wanted, tags):
+  exif_offset = None
+  count = struct.unpack(order + 'H', data[offset:offset + 2])[0]
+  for i in range(count):
+    entry = data[offset + 2 + i * 12:offset + 14 + i * 12]
+    tag, field_type, value_count = struct.unpack(order + 'HHL', entry[:8])
+    if tag == EXIF_IFD_POINTER:
+      exif_offset = struct.unpack(order + 'L', entry[8:12])[0]
+      continue
+    if tag not in wanted or field_type not in TYPE_SIZES:
+      continue
+    size = TYPE_SIZES[field_type] * value_count
+    if size <= 4:
+      raw = entry[8:8 + size]
+    else:
+      value_offset = struct.unpack(order + 'L', entry[8:12])[0]
+      raw = data[value_offset:value_offset + size]
+    tags[wanted[tag]] = format_value(raw, field_type, value_count, order)
+  return exif_offset
+
+"""Format a tag value the way str() prints the value PIL returns for it.
+"""
+def format_value(raw, field_type, value_count, order):
+  if field_type == 2:
+    if raw.endswith('\x00'): raw = raw[:-1]
+    return raw
+  if field_type == 7:
+    return raw
+  values = list(struct.unpack(order + NUMBER_FORMATS[field_type] * value_count, raw))
+  if len(values) == 1:
+    return str(values[0])
+  return str(tuple(values))
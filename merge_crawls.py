@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+# MergeCrawls: Merge several ABrCrawl csv outputs (one per year, for example)
+# into one table sorted by pub_day and deduplicated by photo_page, using a
+# bounded amount of memory.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import sys
+import os
+import getopt
+import csv
+import heapq
+import shutil
+import tempfile
+import dedup
+import output_writers
+
+#CONSTANTS
+DEFAULT_BUFFER_ROWS = 20000
+#the maximum number of runs read at the same time, more runs are merged in passes
+MERGE_FAN_IN = 64
+SORT_KEY = 'pub_day'
+DEDUP_KEY = 'photo_page'
+
+#GLOBAL FLAGS
+verbose = None
+
+def usage():
+  print """
+MergeCrawls
+http://github.com/fczuardi/abrcrawl
+
+Merge csv files generated by the ABrCrawl scripts into one table sorted by
+pub_day (newest first by default) where each photo_page appears only once.
+
+Files that are already in order are merged as they are read. The others are
+sorted in chunks of --buffer-rows rows saved to temporary files, which are
+then merged the same way, so memory use does not grow with the input size.
+Rows from the same day keep the order of the input files (and of the rows in
+each file); when a photo_page is repeated the first row in that order wins.
+The output has all the columns found in the inputs.
+
+Usage:
+  python merge_crawls.py [options] FILE.csv [FILE.csv ...]
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -o, --output-file:\tSave the merged table to a given filename (default stdout).
+  -f, --format:\t\tThe output format. Available formats: %s
+  -a, --ascending:\tSort the oldest days first.
+  --buffer-rows:\tThe number of rows sorted in memory at a time (default %s).
+  --temp-dir:\t\tWhere the sorted chunks are saved (default the system temporary directory).
+  --dedup-db:\t\tKeep the photo pages seen so far in this sqlite file instead of in memory.
+  -v, --verbose:\tPrint extra info while performing the tasks.
+""" % (', '.join(output_writers.FORMATS), DEFAULT_BUFFER_ROWS)
+
+"""A sort key that orders strings from the largest to the smallest.
+"""
+class Descending(object):
+  __slots__ = ['value']
+
+  def __init__(self, value):
+    self.value = value
+
+  def __lt__(self, other):
+    return self.value > other.value
+
+  def __eq__(self, other):
+    return self.value == other.value
+
+def sort_key(row, descending):
+  value = row.get(SORT_KEY) or ''
+  if descending:
+    return Descending(value)
+  return value
+
+def read_rows(path):
+  f = open(path, 'rb')
+  try:
+    for row in csv.DictReader(f):
+      yield row
+  finally:
+    f.close()
+
+def fieldnames(path):
+  f = open(path, 'rb')
+  try:
+    return csv.DictReader(f).fieldnames or []
+  finally:
+    f.close()
+
+"""True when the rows of a csv file are already ordered by pub_day.
+"""
+def is_sorted(path, descending):
+  last = None
+  for row in read_rows(path):
+    value = row.get(SORT_KEY) or ''
+    if last is not None and (value > last if descending else value < last):
+      return False
+    last = value
+  return True
+
+"""Save rows to a temporary csv file, in the given column order.
+"""
+def write_run(rows, keys, temp_dir):
+  fd, path = tempfile.mkstemp(suffix='.csv', dir=temp_dir)
+  f = os.fdopen(fd, 'wb')
+  writer = csv.DictWriter(f, keys, quoting=csv.QUOTE_ALL)
+  writer.writerow(dict(zip(keys, keys)))
+  writer.writerows(rows)
+  f.close()
+  return path
+
+"""Split an unsorted file in sorted runs of at most buffer_rows rows. The sort
+is stable, so rows of the same day keep their order.
+"""
+def sorted_runs(path, keys, buffer_rows, descending, temp_dir):
+  runs = []
+  chunk = []
+  for row in read_rows(path):
+    chunk.append(row)
+    if len(chunk) >= buffer_rows:
+      chunk.sort(key=lambda row: sort_key(row, descending))
+      runs.append(write_run(chunk, keys, temp_dir))
+      chunk = []
+  if chunk:
+    chunk.sort(key=lambda row: sort_key(row, descending))
+    runs.append(write_run(chunk, keys, temp_dir))
+  return runs
+
+"""Merge sorted runs (csv files) into one stream of rows. Ties are broken by
+the position of the run in the list, so earlier runs come first.
+"""
+def merge_runs(runs, descending):
+  heap = []
+  readers = [read_rows(path) for path in runs]
+  for index, reader in enumerate(readers):
+    for row in reader:
+      heap.append((sort_key(row, descending), index, row))
+      break
+  heapq.heapify(heap)
+  while heap:
+    key, index, row = heap[0]
+    yield row
+    for row in readers[index]:
+      heapq.heapreplace(heap, (sort_key(row, descending), index, row))
+      break
+    else:
+      heapq.heappop(heap)
+
+"""Merge runs in passes of MERGE_FAN_IN files until few enough are left to be
+read at the same time. Neighbouring runs are merged together so the order of
+ties is kept.
+"""
+def reduce_runs(runs, keys, descending, temp_dir):
+  while len(runs) > MERGE_FAN_IN:
+    log('Merging %s runs in groups of %s…' % (len(runs), MERGE_FAN_IN))
+    merged = []
+    for i in range(0, len(runs), MERGE_FAN_IN):
+      group = runs[i:i + MERGE_FAN_IN]
+      merged.append(write_run(merge_runs(group, descending), keys, temp_dir))
+      for path in group:
+        if path.startswith(temp_dir): os.remove(path)
+    runs = merged
+  return runs
+
+"""Yield the rows of all the inputs ordered by pub_day, skipping repeated
+photo pages. Temporary files go to a new directory inside temp_dir.
+"""
+def merge_files(paths, buffer_rows=DEFAULT_BUFFER_ROWS, descending=True, temp_dir=None, seen=None, counts=None):
+  seen = seen or dedup.SeenSet()
+  counts = counts if counts is not None else {}
+  counts.setdefault('rows', 0)
+  counts.setdefault('duplicated', 0)
+  keys = all_keys(paths)
+  spill_dir = tempfile.mkdtemp(prefix='merge_crawls-', dir=temp_dir)
+  try:
+    runs = []
+    for path in paths:
+      if is_sorted(path, descending):
+        log('%s is sorted.' % path)
+        runs.append(path)
+      else:
+        file_runs = sorted_runs(path, keys, buffer_rows, descending, spill_dir)
+        log('%s is not sorted, split in %s sorted runs.' % (path, len(file_runs)))
+        runs.extend(file_runs)
+    runs = reduce_runs(runs, keys, descending, spill_dir)
+    for row in merge_runs(runs, descending):
+      counts['rows'] = counts['rows'] + 1
+      if seen.add(dedup.row_fingerprint(row, DEDUP_KEY), counts['rows']) is not None:
+        counts['duplicated'] = counts['duplicated'] + 1
+        continue
+      yield row
+  finally:
+    shutil.rmtree(spill_dir, True)
+
+"""The columns of all the inputs, in the order they first appear.
+"""
+def all_keys(paths):
+  keys = []
+  for path in paths:
+    for key in fieldnames(path):
+      if key not in keys: keys.append(key)
+  return keys
+
+def main():
+  global verbose
+  output_file = sys.stdout
+  results_format = 'csv'
+  descending = True
+  buffer_rows = DEFAULT_BUFFER_ROWS
+  temp_dir = None
+  dedup_db = None
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "ho:f:av", ["help", "output-file=", "format=", "ascending", "buffer-rows=", "temp-dir=", "dedup-db=", "verbose"])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-o", "--output-file"):
+      output_file = file(a, "wb")
+    elif o in ("-f", "--format"):
+      results_format = a
+    elif o in ("-a", "--ascending"):
+      descending = False
+    elif o == "--buffer-rows":
+      buffer_rows = int(a)
+    elif o == "--temp-dir":
+      temp_dir = a
+    elif o == "--dedup-db":
+      dedup_db = a
+    elif o in ("-v", "--verbose"):
+      verbose = True
+    else:
+      assert False, "unhandled option"
+  if not args:
+    return usage()
+  if results_format not in output_writers.FORMATS:
+    print "Unknown output format: %s" % results_format
+    usage()
+    sys.exit(2)
+  seen = dedup.open_seen_set(dedup_db)
+  counts = {}
+  writer = output_writers.open_writer(results_format, output_file, all_keys(args))
+  batch = []
+  for row in merge_files(args, buffer_rows, descending, temp_dir, seen, counts):
+    batch.append(row)
+    if len(batch) >= 500:
+      writer.write_rows(batch)
+      batch = []
+  writer.write_rows(batch)
+  writer.close()
+  output_file.close()
+  seen.close()
+  log('Merge finished. %s rows read, %s duplicated photo pages skipped.' % (counts['rows'], counts['duplicated']))
+
+def log(m):
+  global verbose
+  if verbose: print >> sys.stderr, m
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# OutputWriters: Streaming writers for the tables produced by the ABrCrawl
+# scripts. Rows are written and flushed as soon as they are available so
+# long crawls never need to keep the whole table in memory.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import csv
+import simplejson as json
+
+"""Write rows as a csv table with a fixed column order.
+"""
+class CsvWriter(object):
+  def __init__(self, output_file, keys, header=True):
+    self.output_file = output_file
+    self.keys = keys
+    self.writer = csv.DictWriter(output_file, keys, quoting=csv.QUOTE_ALL)
+    if header:
+      self.output_file.write("%s\n" % ','.join(keys))
+      self.output_file.flush()
+
+  def write_rows(self, rows):
+    self.writer.writerows(rows)
+    self.output_file.flush()
+
+  def close(self):
+    self.output_file.flush()
+
+"""Write one json object per line (newline delimited json).
+"""
+class NdjsonWriter(object):
+  def __init__(self, output_file):
+    self.output_file = output_file
+
+  def write_rows(self, rows):
+    for row in rows:
+      self.output_file.write("%s\n" % json.dumps(row))
+    self.output_file.flush()
+
+  def close(self):
+    self.output_file.flush()
+
+"""Write a json array one item at a time. The output is the same as dumping
+the whole list at once with json.dumps.
+"""
+class JsonArrayWriter(object):
+  def __init__(self, output_file, indent=None):
+    self.output_file = output_file
+    self.indent = indent
+    self.count = 0
+    self.output_file.write('[')
+
+  def write_rows(self, rows):
+    for row in rows:
+      item = json.dumps(row, indent=self.indent)
+      if self.indent is None:
+        separator = ', ' if self.count else ''
+      else:
+        separator = ',\n' if self.count else '\n'
+        item = '\n'.join([' ' * self.indent + line for line in item.split('\n')])
+      self.output_file.write(separator + item)
+      self.count = self.count + 1
+    self.output_file.flush()
+
+  def close(self):
+    if self.indent is not None and self.count:
+      self.output_file.write('\n')
+    self.output_file.write(']')
+    self.output_file.flush()
+
+FORMATS = ['csv', 'ndjson', 'json']
+APPENDABLE_FORMATS = ['csv', 'ndjson']
+
+"""Return the streaming writer for a given output format. When appending to
+an existing output (header=False) the csv header is not written again.
+"""
+def open_writer(fmt, output_file, keys, indent=None, header=True):
+  if fmt == 'csv':
+    return CsvWriter(output_file, keys, header)
+  elif fmt == 'ndjson':
+    return NdjsonWriter(output_file)
+  elif fmt == 'json':
+    return JsonArrayWriter(output_file, indent)
+  raise ValueError('Unknown output format: %s' % fmt)
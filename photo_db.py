@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# PhotoDB: Store the tables produced by the ABrCrawl scripts in a local sqlite
+# database, one row per photo page, so later steps can enrich it in place.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import sqlite3
+import threading
+import image_index
+
+#CONSTANTS
+CRAWL_KEYS = ['pub_day', 'thumbnail_url', 'photo_page', 'description', 'author']
+DATE_KEYS = ['created_date', 'updated_date']
+COLUMNS = CRAWL_KEYS + DATE_KEYS + image_index.INFO_KEYS
+READ_BATCH_SIZE = 500
+WRITE_BATCH_SIZE = 500
+
+"""A sqlite file with a photos table keyed by photo_page and indexed by
+pub_day and author. Rows are upserted: only the columns present in a row are
+written, so re-crawled rows keep the dates and image info added later.
+The connection may be shared by several threads.
+"""
+class PhotoDatabase(object):
+  def __init__(self, path):
+    self.path = path
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.text_factory = str
+    self.lock = threading.RLock()
+    self.db.execute('CREATE TABLE IF NOT EXISTS photos (photo_page TEXT PRIMARY KEY, %s)' % ', '.join([key for key in COLUMNS if key != 'photo_page']))
+    self.db.execute('CREATE INDEX IF NOT EXISTS photos_pub_day ON photos (pub_day)')
+    self.db.execute('CREATE INDEX IF NOT EXISTS photos_author ON photos (author)')
+    self.db.commit()
+
+  """Insert or update rows in a single transaction.
+  """
+  def upsert(self, rows):
+    groups = {}
+    for row in rows:
+      keys = tuple([key for key in COLUMNS if key in row and key != 'photo_page'])
+      groups.setdefault(keys, []).append(row)
+    self.lock.acquire()
+    try:
+      for keys, group in groups.items():
+        if keys:
+          self.db.executemany('UPDATE photos SET %s WHERE photo_page = ?' % ', '.join(['%s = ?' % key for key in keys]),
+            [[row[key] for key in keys] + [row['photo_page']] for row in group])
+        self.db.executemany('INSERT OR IGNORE INTO photos (photo_page%s) VALUES (?%s)' % (''.join([', %s' % key for key in keys]), ', ?' * len(keys)),
+          [[row['photo_page']] + [row[key] for key in keys] for row in group])
+      self.db.commit()
+    except:
+      self.db.rollback()
+      raise
+    finally:
+      self.lock.release()
+
+  def reader(self, where=None):
+    return DatabaseReader(self, where)
+
+  def writer(self, batch_size=1):
+    return DatabaseWriter(self, batch_size)
+
+  def close(self):
+    self.lock.acquire()
+    try:
+      self.db.commit()
+      self.db.close()
+    finally:
+      self.lock.release()
+
+"""Iterate over the rows of the database like a csv.DictReader (it has the
+fieldnames and line_num attributes too). Rows are read in batches, ordered
+by insertion, so the table can be updated while it is being read.
+"""
+class DatabaseReader(object):
+  def __init__(self, database, where=None):
+    self.database = database
+    self.where = where
+    self.fieldnames = COLUMNS[:]
+    self.line_num = 0
+
+  def __iter__(self):
+    last_rowid = 0
+    condition = ' AND (%s)' % self.where if self.where else ''
+    while True:
+      self.database.lock.acquire()
+      try:
+        batch = self.database.db.execute('SELECT rowid, %s FROM photos WHERE rowid > ?%s ORDER BY rowid LIMIT ?' % (', '.join(COLUMNS), condition), (last_rowid, READ_BATCH_SIZE)).fetchall()
+      finally:
+        self.database.lock.release()
+      if not batch: break
+      for values in batch:
+        last_rowid = values[0]
+        self.line_num = self.line_num + 1
+        row = {}
+        for key, value in zip(COLUMNS, values[1:]):
+          row[key] = value if value is not None else ''
+        yield row
+
+"""Streaming writer (same interface as the ones in output_writers) that
+upserts the rows into the database, one transaction per batch_size rows.
+"""
+class DatabaseWriter(object):
+  def __init__(self, database, batch_size=1):
+    self.database = database
+    self.batch_size = batch_size
+    self.pending = []
+
+  def write_rows(self, rows):
+    self.pending.extend(rows)
+    if len(self.pending) >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+    if self.pending:
+      self.database.upsert(self.pending)
+      self.pending = []
+
+  def close(self):
+    self.flush()
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+# Pipeline: Crawl the gallery, add the photo page dates and the local image info
+# in one pass, streaming each row through the stages as soon as it is ready.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import sys
+import getopt
+import time
+import abrcrawl
+import add_proper_dates
+import add_images_info
+import workerpool
+import scheduler
+import http_cache
+import output_writers
+import photo_db
+import stats
+
+#CONSTANTS
+OUTPUT_FORMATS = output_writers.FORMATS + ['sqlite']
+OUTPUT_KEYS = photo_db.COLUMNS
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_DATE_WORKERS = 4
+DEFAULT_PROBE_WORKERS = 2
+
+#GLOBAL FLAGS
+verbose = None
+
+def usage():
+  print """
+Pipeline
+http://github.com/fczuardi/abrcrawl
+
+Do the work of abrcrawl.py, add_proper_dates.py and add_images_info.py in a
+single run without intermediate files. The stages (gallery pages, photo page
+dates, local image info, output) run at the same time with bounded queues
+between them, so rows are written as soon as they go through all the stages.
+Rows whose dates or image could not be read are kept with empty columns.
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -d, --date:\t\tA starting date in the YYYY/MM/DD format.
+  -p, --pages:\t\tThe number of gallery pages to retrieve (default 1).
+  --images-dir:\t\tThe directory with the local copies of the images, the image info stage is skipped without it.
+  -f, --format:\t\tThe output format. Available formats: %s
+  -i, --indent:\t\tIf output format can be pretty printed(json for example) use the number of white spaces to use as indent level.
+  -o, --output-file:\tSave the output to a given filename (required by the sqlite format).
+  --crawl-workers:\tThe number of gallery pages downloaded at the same time (default 1).
+  -w, --workers:\tThe number of photo pages downloaded at the same time (default %s).
+  --probe-workers:\tThe number of images read at the same time (default %s).
+  --queue-size:\t\tThe maximum number of rows waiting between two stages (default %s).
+  --host-connections:\tThe maximum number of simultaneous requests to the same host (default %s).
+  --retries:\t\tThe number of times a request is tried again after a timeout or an error like 503 (default %s).
+  --cache-dir:\t\tKeep downloaded pages in this directory and reuse them on later runs.
+  --max-age:\t\tSeconds a cached page is used without asking the server if it changed (default 0).
+  --offline:\t\tOnly use pages from the cache, never access the network.
+  --stats:\t\tSave timings, HTTP status counts, bytes downloaded and cache hit rates to this JSON file.
+  --progress:\t\tPrint a progress line to stderr every N seconds.
+  -v, --verbose:\tPrint extra info while performing the tasks.
+""" % (', '.join(OUTPUT_FORMATS), DEFAULT_DATE_WORKERS, DEFAULT_PROBE_WORKERS, DEFAULT_QUEUE_SIZE, abrcrawl.DEFAULT_HOST_CONNECTIONS, scheduler.DEFAULT_RETRIES)
+
+"""First stage: the rows of the gallery pages, in page order.
+"""
+def crawl_rows(start_date, page_total, workers):
+  fetch = lambda i: (i, abrcrawl.get_page(i, start_date))
+  for i, content in workerpool.ordered_map(fetch, range(1, page_total + 1), workers):
+    if not content:
+      stats.default_stats.count('pages.failed')
+      log('Page %s could not be downloaded.' % i)
+      continue
+    started = time.time()
+    rows = abrcrawl.extract_data(content)
+    stats.default_stats.observe('parse.gallery', time.time() - started)
+    stats.default_stats.count('pages')
+    for row in rows:
+      yield row
+
+"""Second stage: add the created_date and updated_date of each photo page.
+"""
+def dated_rows(rows, workers):
+  for row, dates in workerpool.ordered_map(add_proper_dates.enrich_row, rows, workers):
+    if dates is None:
+      stats.default_stats.count('rows.dates_failed')
+      dates = ['', '']
+    row['created_date'], row['updated_date'] = dates
+    yield row
+
+"""Third stage: add the format, size and Exif info of the local image copy.
+"""
+def image_rows(rows, images_dir, workers):
+  def probe(row):
+    abr_filename, image_path = add_images_info.local_image(row, images_dir)
+    return add_images_info.probe_image((row, abr_filename, image_path, None))
+  for (row, abr_filename, image_path, cached), status, info, seconds in workerpool.ordered_map(probe, rows, workers):
+    stats.default_stats.count('images.%s' % status)
+    stats.default_stats.observe('probe', seconds)
+    if status != 'ok':
+      info = dict([(key, '') for key in add_images_info.image_index.INFO_KEYS])
+    row.update(info)
+    yield row
+
+def main():
+  global verbose
+  start_date = None
+  page_total = 1
+  images_dir = None
+  results_format = 'csv'
+  indent_level = None
+  output_file = sys.stdout
+  output_file_name = None
+  crawl_workers = 1
+  date_workers = DEFAULT_DATE_WORKERS
+  probe_workers = DEFAULT_PROBE_WORKERS
+  queue_size = DEFAULT_QUEUE_SIZE
+  host_connections = abrcrawl.DEFAULT_HOST_CONNECTIONS
+  retries = scheduler.DEFAULT_RETRIES
+  cache_dir = None
+  cache_max_age = 0
+  offline = False
+  stats_file_name = None
+  progress_interval = 0
+  if(len(sys.argv) < 2):
+    return usage()
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hd:p:f:i:o:w:v", ["help", "date=", "pages=", "images-dir=", "format=", "indent=", "output-file=", "crawl-workers=", "workers=", "probe-workers=", "queue-size=", "host-connections=", "retries=", "cache-dir=", "max-age=", "offline", "stats=", "progress=", "verbose"])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-d", "--date"):
+      start_date = a
+    elif o in ("-p", "--pages"):
+      page_total = int(a)
+    elif o == "--images-dir":
+      images_dir = a
+    elif o in ("-f", "--format"):
+      results_format = a
+    elif o in ("-i", "--indent"):
+      indent_level = int(a)
+    elif o in ("-o", "--output-file"):
+      output_file_name = a
+    elif o == "--crawl-workers":
+      crawl_workers = int(a)
+    elif o in ("-w", "--workers"):
+      date_workers = int(a)
+    elif o == "--probe-workers":
+      probe_workers = int(a)
+    elif o == "--queue-size":
+      queue_size = int(a)
+    elif o == "--host-connections":
+      host_connections = int(a)
+    elif o == "--retries":
+      retries = int(a)
+    elif o == "--cache-dir":
+      cache_dir = a
+    elif o == "--max-age":
+      cache_max_age = int(a)
+    elif o == "--offline":
+      offline = True
+    elif o == "--stats":
+      stats_file_name = a
+    elif o == "--progress":
+      progress_interval = float(a)
+    elif o in ("-v", "--verbose"):
+      verbose = True
+    else:
+      assert False, "unhandled option"
+  if results_format not in OUTPUT_FORMATS:
+    print "Unknown output format: %s" % results_format
+    usage()
+    sys.exit(2)
+  if results_format == 'sqlite' and not output_file_name:
+    print "The sqlite format requires an --output-file."
+    sys.exit(2)
+  if offline and not cache_dir:
+    print "The --offline option requires a --cache-dir."
+    sys.exit(2)
+  #the stage modules log to stdout, keep it clean when the rows go there
+  abrcrawl.verbose = add_proper_dates.verbose = verbose and output_file_name is not None
+  #both fetching stages share the limits of the host
+  abrcrawl.request_scheduler = add_proper_dates.request_scheduler = scheduler.RequestScheduler(host_connections, retries)
+  if cache_dir:
+    abrcrawl.response_cache = add_proper_dates.response_cache = http_cache.ResponseCache(cache_dir, http_cache.DEFAULT_MAX_SIZE, cache_max_age, offline)
+  if results_format == 'sqlite':
+    output_file = photo_db.PhotoDatabase(output_file_name)
+    writer = output_file.writer(photo_db.WRITE_BATCH_SIZE)
+  else:
+    if output_file_name:
+      output_file = file(output_file_name, "wb")
+    keys = OUTPUT_KEYS if images_dir else photo_db.CRAWL_KEYS + photo_db.DATE_KEYS
+    writer = output_writers.open_writer(results_format, output_file, keys, indent_level)
+  stats.default_stats.progress_keys = ['pages', 'rows']
+  if progress_interval:
+    stats.default_stats.start_progress(progress_interval)
+  rows = workerpool.buffered(crawl_rows(start_date, page_total, crawl_workers), queue_size)
+  rows = workerpool.buffered(dated_rows(rows, date_workers), queue_size)
+  if images_dir:
+    rows = workerpool.buffered(image_rows(rows, images_dir, probe_workers), queue_size)
+  started = time.time()
+  for row in rows:
+    if not stats.default_stats.counters.get('rows'):
+      stats.default_stats.observe('first_row', time.time() - started)
+      log('First row ready after %.2f seconds.' % (time.time() - started))
+    writer.write_rows([row])
+    stats.default_stats.count('rows')
+  writer.close()
+  output_file.close()
+  stats.finish(stats_file_name)
+  log('Pipeline finished, %s rows written in %.2f seconds.' % (stats.default_stats.counters.get('rows', 0), time.time() - started))
+
+def log(m):
+  global verbose
+  if verbose: print >> sys.stderr, m
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+# PtDates: Convert the Portuguese dates found on the Agencia Brasil pages
+# (9 de Dezembro de 2009, 31 de Dezembro de 2006 - 17h32) to ISO 8601.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import re
+import threading
+
+#CONSTANTS
+MONTHS = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+MONTH_NUMBERS = dict([(name, i + 1) for i, name in enumerate(MONTHS)])
+DAY_PATTERN = re.compile(r'([0-9]+) de (%s) de ([0-9]+)\s*' % '|'.join(MONTHS))
+TIMESTAMP_PATTERN = re.compile(r'([0-9]+) de (.*?) de ([0-9]+) - (..)h(..)', re.S)
+TIMEZONE = '-03:00'
+#the number of distinct inputs remembered by each cache before it is emptied
+MAX_CACHE_SIZE = 10000
+
+"""Remember the results of a one argument function. The results are kept until
+MAX_CACHE_SIZE different arguments were seen, then the cache starts over.
+"""
+class Memo(object):
+  def __init__(self, func):
+    self.func = func
+    self.cache = {}
+    self.lock = threading.Lock()
+
+  def __call__(self, value):
+    try:
+      return self.cache[value]
+    except KeyError:
+      pass
+    result = self.func(value)
+    self.lock.acquire()
+    try:
+      if len(self.cache) >= MAX_CACHE_SIZE:
+        self.cache = {}
+      self.cache[value] = result
+    finally:
+      self.lock.release()
+    return result
+
+  def clear(self):
+    self.cache = {}
+
+def replace_day(matches):
+  day, month, year = matches.groups()
+  return '%s-%02d-%s' % (year, MONTH_NUMBERS[month], day.zfill(2))
+
+"""Replace the day level dates of a text (9 de Dezembro de 2009) by their ISO
+form (2009-12-09). Text without dates is returned unchanged.
+"""
+def convert_day(text):
+  return DAY_PATTERN.sub(replace_day, text)
+
+"""The ISO timestamp, in Brasília time, of the first date and time of a text
+(31 de Dezembro de 2006 - 17h32 gives 2006-12-31T17:32-03:00), or None.
+"""
+def convert_timestamp(text):
+  matches = TIMESTAMP_PATTERN.search(text)
+  if not matches: return None
+  day, month, year, hour, minute = matches.groups()
+  if month not in MONTH_NUMBERS: return None
+  try:
+    return '%d-%02d-%02dT%02d:%02d%s' % (int(year), MONTH_NUMBERS[month], int(day), int(hour), int(minute), TIMEZONE)
+  except ValueError:
+    return None
+
+iso_day = Memo(convert_day)
+iso_timestamp = Memo(convert_timestamp)
+
+"""Convert a whole column of day level dates. Each distinct value is converted
+once.
+"""
+def iso_days(values):
+  return map(iso_day, values)
+
+"""Convert a whole column of timestamps, None for the values without one.
+"""
+def iso_timestamps(values):
+  return map(iso_timestamp, values)
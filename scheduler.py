@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+# Scheduler: Send the requests of the ABrCrawl scripts with retries, backoff
+# and a per host concurrency limit that adapts to the server's answers.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import time
+import random
+import socket
+import httplib
+import urllib2
+import rfc822
+import workerpool
+import stats
+
+#CONSTANTS
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 60.0
+MAX_RETRY_AFTER = 600
+#answers worth trying again, the overload ones also reduce the concurrency
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+OVERLOAD_STATUSES = [429, 503, 504]
+
+"""Tell how a failed request should be handled: 'overload' when the server is
+struggling (retry and slow down), 'retry' for other transient failures and
+None for errors that would not go away by trying again (404, offline cache
+misses, ...).
+"""
+def classify(error):
+  if isinstance(error, urllib2.HTTPError):
+    if error.code in OVERLOAD_STATUSES: return 'overload'
+    if error.code in RETRY_STATUSES: return 'retry'
+    return None
+  reason = getattr(error, 'reason', None)
+  if isinstance(reason, socket.timeout) or reason == 'timed out':
+    return 'overload'
+  if isinstance(reason, (socket.error, httplib.HTTPException)):
+    return 'retry'
+  return None
+
+"""The seconds asked by the Retry-After header of an HTTPError, given either as
+a number of seconds or as an HTTP date. None when there is no valid header.
+"""
+def retry_after(error):
+  headers = getattr(error, 'hdrs', None)
+  value = headers and headers.getheader('Retry-After')
+  if not value: return None
+  value = value.strip()
+  if value.isdigit():
+    seconds = int(value)
+  else:
+    date = rfc822.parsedate_tz(value)
+    if not date: return None
+    seconds = rfc822.mktime_tz(date) - time.time()
+  return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+"""Run the requests of several worker threads through a shared AdaptiveLimiter
+(at most max_connections per host) and RateLimiter. Failed requests are tried
+again up to `retries` times, waiting a random time between 0 and
+backoff * 2^attempt seconds (capped at max_backoff), or longer if the server
+sent a Retry-After header, in which case the whole host is paused.
+"""
+class RequestScheduler(object):
+  def __init__(self, max_connections, retries=DEFAULT_RETRIES, rate=0, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF):
+    self.limiter = workerpool.AdaptiveLimiter(max_connections)
+    self.rate_limiter = workerpool.RateLimiter(rate)
+    self.retries = retries
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.random = random.Random()
+
+  def delay(self, attempt):
+    return self.random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+  """Return func(url), retrying on transient errors. The last error is raised
+  when all the attempts fail.
+  """
+  def call(self, url, func):
+    attempt = 0
+    while True:
+      self.rate_limiter.wait(url)
+      self.limiter.acquire(url)
+      started = time.time()
+      try:
+        result = func(url)
+      except urllib2.URLError, e:
+        kind = classify(e)
+        self.limiter.release(url, kind != 'overload', started)
+        if kind == 'overload':
+          stats.default_stats.count('scheduler.overloads')
+        if kind is None:
+          raise
+        if attempt >= self.retries:
+          stats.default_stats.count('scheduler.gave_up')
+          raise
+        wait = self.delay(attempt)
+        server_wait = retry_after(e)
+        if server_wait is not None:
+          self.limiter.pause(url, server_wait)
+          wait = max(wait, server_wait)
+        stats.default_stats.count('scheduler.retries')
+        time.sleep(wait)
+        attempt = attempt + 1
+        continue
+      except:
+        self.limiter.release(url, True, started)
+        raise
+      self.limiter.release(url, True, started)
+      return result
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+# Stats: Counters, timing histograms and progress lines shared by the ABrCrawl
+# scripts, written as a JSON summary with the --stats option.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import sys
+import time
+import threading
+import simplejson as json
+
+#CONSTANTS
+#upper bounds of the timing histogram buckets, in milliseconds
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+PERCENTILES = [50, 90, 99]
+
+"""The distribution of the durations recorded under one name.
+"""
+class Timing(object):
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+    self.buckets = [0] * (len(BUCKETS) + 1)
+
+  def add(self, seconds):
+    ms = seconds * 1000
+    self.count = self.count + 1
+    self.total = self.total + ms
+    if self.min is None or ms < self.min: self.min = ms
+    if self.max is None or ms > self.max: self.max = ms
+    for i, bound in enumerate(BUCKETS):
+      if ms <= bound:
+        self.buckets[i] = self.buckets[i] + 1
+        return
+    self.buckets[-1] = self.buckets[-1] + 1
+
+  """The upper bound of the bucket holding the p-th percentile, the largest
+  duration seen when it falls past the last bucket.
+  """
+  def percentile(self, p):
+    if not self.count: return None
+    wanted = self.count * p / 100.0
+    seen = 0
+    for i, count in enumerate(self.buckets[:-1]):
+      seen = seen + count
+      if seen >= wanted:
+        return round(min(BUCKETS[i], self.max), 3)
+    return round(self.max, 3)
+
+  def summary(self):
+    result = {
+      'count': self.count,
+      'total_ms': round(self.total, 3),
+      'mean_ms': round(self.total / self.count, 3) if self.count else None,
+      'min_ms': round(self.min, 3) if self.count else None,
+      'max_ms': round(self.max, 3) if self.count else None,
+      'histogram': dict(('<=%sms' % bound, count) for bound, count in zip(BUCKETS, self.buckets) if count),
+    }
+    if self.buckets[-1]:
+      result['histogram']['>%sms' % BUCKETS[-1]] = self.buckets[-1]
+    for p in PERCENTILES:
+      result['p%s_ms' % p] = self.percentile(p)
+    return result
+
+"""Thread safe counters and timings. Counter names are dotted, the ones
+listed in progress_keys are shown (with their rate) in the progress lines.
+"""
+class Stats(object):
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.started = time.time()
+    self.counters = {}
+    self.timings = {}
+    self.progress_keys = []
+    self.progress_thread = None
+    self.progress_stop = threading.Event()
+
+  def count(self, name, value=1):
+    self.lock.acquire()
+    try:
+      self.counters[name] = self.counters.get(name, 0) + value
+    finally:
+      self.lock.release()
+
+  def observe(self, name, seconds):
+    self.lock.acquire()
+    try:
+      if name not in self.timings:
+        self.timings[name] = Timing()
+      self.timings[name].add(seconds)
+    finally:
+      self.lock.release()
+
+  def elapsed(self):
+    return time.time() - self.started
+
+  """Hit rate of the response cache, counting revalidated entries as hits.
+  """
+  def cache_hit_rate(self):
+    hits = self.counters.get('cache.hit', 0) + self.counters.get('cache.revalidated', 0)
+    total = hits + self.counters.get('cache.miss', 0)
+    if not total: return None
+    return round(float(hits) / total, 4)
+
+  def summary(self):
+    self.lock.acquire()
+    try:
+      elapsed = self.elapsed()
+      return {
+        'elapsed_seconds': round(elapsed, 3),
+        'counters': dict(self.counters),
+        'rates_per_second': dict((name, round(value / elapsed, 3)) for name, value in self.counters.items()),
+        'timings': dict((name, timing.summary()) for name, timing in self.timings.items()),
+        'cache_hit_rate': self.cache_hit_rate(),
+      }
+    finally:
+      self.lock.release()
+
+  def write(self, path):
+    f = open(path, 'wb')
+    json.dump(self.summary(), f, indent=2, sort_keys=True)
+    f.write('\n')
+    f.close()
+
+  def progress_line(self):
+    self.lock.acquire()
+    try:
+      elapsed = self.elapsed()
+      parts = ['%ds' % elapsed]
+      for name in self.progress_keys:
+        value = self.counters.get(name, 0)
+        parts.append('%s %s (%.1f/s)' % (name, value, value / elapsed))
+      fetch = self.timings.get('http.fetch')
+      if fetch and fetch.count:
+        parts.append('fetch p50 %.0fms p90 %.0fms' % (fetch.percentile(50), fetch.percentile(90)))
+      hit_rate = self.cache_hit_rate()
+      if hit_rate is not None:
+        parts.append('cache hits %.0f%%' % (hit_rate * 100))
+      return ', '.join(parts)
+    finally:
+      self.lock.release()
+
+  """Print a progress line to the output every `interval` seconds, from a
+  background thread, until stop_progress() is called.
+  """
+  def start_progress(self, interval, output=sys.stderr):
+    def report():
+      while not self.progress_stop.wait(interval) and not self.progress_stop.isSet():
+        output.write('[progress] %s\n' % self.progress_line())
+        output.flush()
+    self.progress_thread = threading.Thread(target=report)
+    self.progress_thread.setDaemon(True)
+    self.progress_thread.start()
+
+  def stop_progress(self):
+    if self.progress_thread:
+      self.progress_stop.set()
+      self.progress_thread.join()
+      self.progress_thread = None
+
+"""Stop the progress lines and save the summary to stats_file_name, if any.
+"""
+def finish(stats_file_name=None):
+  default_stats.stop_progress()
+  if stats_file_name:
+    default_stats.write(stats_file_name)
+
+#the stats shared by all the modules of a run
+default_stats = Stats()
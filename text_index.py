@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+
+# TextIndex: A full text index of the ABrCrawl photo descriptions and authors,
+# with accent insensitive search by words, phrases, author and dates.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import sys
+import re
+import csv
+import time
+import bisect
+import getopt
+import sqlite3
+import unicodedata
+import dedup
+import photo_db
+import output_writers
+from column_archive import packed_array, unpacked_array
+
+#CONSTANTS
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+AUTHOR_PREFIX = 'author:'
+INDEX_BATCH_SIZE = 2000
+#sqlite limits the number of parameters of a query
+SELECT_BATCH_SIZE = 500
+#candidate lists longer than the documents / SCAN_RATIO are matched walking the pub_day index
+SCAN_RATIO = 4
+#lists longer than the shorter one times BISECT_RATIO are searched by bisection
+BISECT_RATIO = 16
+INDEXED_KEYS = ['pub_day', 'description', 'author']
+
+#GLOBAL FLAGS
+verbose = None
+
+def usage():
+  print """
+TextIndex
+http://github.com/fczuardi/abrcrawl
+
+Index the descriptions and authors of ABrCrawl csv files and search them.
+Accents and case are ignored, so acao finds Ação. Adding a file again only
+indexes its new or changed rows.
+
+Usage:
+  text_index.py -d INDEX --add photos.csv [--add more.csv]
+  text_index.py -d INDEX [-a AUTHOR] [--from DAY] [--to DAY] 'words "a phrase"'
+
+All the words and phrases of the query must be in the description.
+
+Parameters:
+  -h, --help:\t\tPrint this message.
+  -d, --index:\t\tThe index file (sqlite).
+  --add:\t\tIndex the rows of this csv file (- for stdin).
+  --compact:\t\tRemove the entries of replaced rows from the index.
+  -a, --author:\t\tOnly return photos by this author (all its words must match).
+  --from:\t\tOnly return photos of this day (YYYY-MM-DD) or later.
+  --to:\t\t\tOnly return photos of this day (YYYY-MM-DD) or earlier.
+  -l, --limit:\t\tReturn at most this many photos, newest first.
+  -o, --output-file:\tWhere to save the results (default stdout).
+  -f, --format:\t\tThe output format. Available formats: %s
+  -v, --verbose:\tPrint extra info while performing the tasks.
+""" % ', '.join(output_writers.FORMATS)
+
+def strip_accents(text):
+  text = unicodedata.normalize('NFKD', text)
+  return u''.join([c for c in text if not unicodedata.combining(c)])
+
+#the latin letters with accents (and the combining accents) mapped to plain letters,
+#translate() with it is much faster than decomposing every description
+ACCENTS = dict([(code, strip_accents(unichr(code))) for code in range(0xa0, 0x250) + range(0x300, 0x370) if strip_accents(unichr(code)) != unichr(code)])
+
+"""Lower case text without accents, so the index and the queries match
+ignoring both.
+"""
+def normalize(text):
+  if not isinstance(text, unicode):
+    text = text.decode('utf-8', 'replace')
+  return text.translate(ACCENTS).lower()
+
+def tokenize(text):
+  return [token.encode('utf-8') for token in TOKEN_PATTERN.findall(normalize(text or ''))]
+
+"""The words and phrases (lists of words) of a query, phrases are written
+between double quotes.
+"""
+def parse_query(query):
+  words = []
+  phrases = []
+  for phrase, word in QUERY_PATTERN.findall(query):
+    if phrase:
+      tokens = tokenize(phrase)
+      if len(tokens) > 1:
+        phrases.append(tokens)
+      else:
+        words.extend(tokens)
+    else:
+      words.extend(tokenize(word))
+  return words, phrases
+
+"""Tokens joined by spaces (and surrounded by them), a phrase is in a
+description when its joined tokens are in the joined tokens of the
+description.
+"""
+def joined(tokens):
+  return ' %s ' % ' '.join(tokens)
+
+"""The documents in all the sorted lists of document ids, the shortest list
+is walked and looked up in the others (by bisection when the other list is
+much longer, through a set otherwise).
+"""
+def intersect(postings):
+  postings = sorted(postings, key=len)
+  documents = postings[0]
+  for other in postings[1:]:
+    if len(documents) * BISECT_RATIO < len(other):
+      found = []
+      for document in documents:
+        i = bisect.bisect_left(other, document)
+        if i < len(other) and other[i] == document:
+          found.append(document)
+    else:
+      other = set(other)
+      found = [document for document in documents if document in other]
+    documents = found
+    if not documents: break
+  return list(documents)
+
+"""The sql WHERE clause (and its parameters) selecting the days between
+first_day and last_day.
+"""
+def day_conditions(first_day=None, last_day=None):
+  conditions = []
+  parameters = []
+  if first_day:
+    conditions.append('pub_day >= ?')
+    parameters.append(first_day)
+  if last_day:
+    conditions.append('pub_day <= ?')
+    parameters.append(last_day)
+  if not conditions:
+    return '', parameters
+  return ' WHERE %s' % ' AND '.join(conditions), parameters
+
+"""An inverted index kept in a sqlite file. Each term has the sorted list of
+the documents (rows) where it appears, stored as an array of numbers. Rows are
+keyed by photo_page: a row added again with other values gets a new document
+and the old one is dropped from the documents table (its stale entries in the
+postings are ignored until compact() removes them).
+"""
+class TextIndex(object):
+  def __init__(self, path):
+    self.db = sqlite3.connect(path)
+    self.db.text_factory = str
+    self.db.execute('CREATE TABLE IF NOT EXISTS documents (document INTEGER PRIMARY KEY AUTOINCREMENT, photo_page TEXT UNIQUE, fingerprint TEXT, words TEXT, %s)' % ', '.join([key for key in photo_db.CRAWL_KEYS if key != 'photo_page']))
+    self.db.execute('CREATE INDEX IF NOT EXISTS documents_pub_day ON documents (pub_day)')
+    self.db.execute('CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, postings BLOB)')
+    self.db.commit()
+
+  """Index the rows (dicts with the ABrCrawl columns) in batches, one
+  transaction per batch. When the rows repeat a photo_page the first one wins
+  (like merge_crawls.py), so adding the same rows again changes nothing.
+  Returns the counts of new, updated, unchanged and repeated rows.
+  """
+  def add_rows(self, rows):
+    counts = {'new': 0, 'updated': 0, 'unchanged': 0, 'repeated': 0}
+    seen = dedup.SeenSet()
+    batch = []
+    for row in rows:
+      if seen.add(dedup.row_fingerprint(row, 'photo_page')) is not None:
+        counts['repeated'] = counts['repeated'] + 1
+        continue
+      batch.append(row)
+      if len(batch) >= INDEX_BATCH_SIZE:
+        self.add_batch(batch, counts)
+        batch = []
+    self.add_batch(batch, counts)
+    seen.close()
+    return counts
+
+  def add_batch(self, rows, counts):
+    postings = {}
+    keys = [key for key in photo_db.CRAWL_KEYS if key != 'photo_page']
+    try:
+      for row in rows:
+        fingerprint = '\x1f'.join([row.get(key) or '' for key in INDEXED_KEYS])
+        found = self.db.execute('SELECT fingerprint FROM documents WHERE photo_page = ?', (row['photo_page'],)).fetchone()
+        if found and found[0] == fingerprint:
+          counts['unchanged'] = counts['unchanged'] + 1
+          continue
+        if found:
+          self.db.execute('DELETE FROM documents WHERE photo_page = ?', (row['photo_page'],))
+          counts['updated'] = counts['updated'] + 1
+        else:
+          counts['new'] = counts['new'] + 1
+        words = tokenize(row.get('description'))
+        cursor = self.db.execute('INSERT INTO documents (photo_page, fingerprint, words, %s) VALUES (?, ?, ?%s)' % (', '.join(keys), ', ?' * len(keys)),
+          [row['photo_page'], fingerprint, joined(words)] + [row.get(key) or '' for key in keys])
+        #document ids only grow (AUTOINCREMENT), so appending keeps the postings sorted
+        document = cursor.lastrowid
+        terms = set(words)
+        terms.update([AUTHOR_PREFIX + token for token in tokenize(row.get('author'))])
+        for term in terms:
+          postings.setdefault(term, []).append(document)
+      for term, documents in postings.items():
+        found = self.db.execute('SELECT postings FROM terms WHERE term = ?', (term,)).fetchone()
+        data = (str(found[0]) if found else '') + packed_array('I', documents)
+        self.db.execute('INSERT OR REPLACE INTO terms VALUES (?, ?)', (term, buffer(data)))
+      self.db.commit()
+    except:
+      self.db.rollback()
+      raise
+    log('%(new)s new, %(updated)s updated, %(unchanged)s unchanged and %(repeated)s repeated rows.' % counts)
+
+  def postings(self, term):
+    found = self.db.execute('SELECT postings FROM terms WHERE term = ?', (term,)).fetchone()
+    if not found: return []
+    return unpacked_array('I', str(found[0]))
+
+  """The rows (dicts with the given columns) of some documents matching an
+  extra sql condition, skipping the ones that were replaced.
+  """
+  def documents(self, documents, keys, condition='', parameters=[]):
+    rows = []
+    documents = list(documents)
+    for i in xrange(0, len(documents), SELECT_BATCH_SIZE):
+      batch = documents[i:i + SELECT_BATCH_SIZE]
+      rows.extend(self.db.execute('SELECT %s FROM documents WHERE document IN (%s)%s' % (', '.join(keys), ', '.join(['?'] * len(batch)), condition), batch + parameters).fetchall())
+    return [dict(zip(keys, values)) for values in rows]
+
+  """The candidate documents still in the table and published between
+  first_day and last_day, newest first. Few candidates are looked up one by
+  one, many are picked while walking the pub_day index.
+  """
+  def ordered(self, candidates, first_day=None, last_day=None):
+    size = self.db.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+    if len(candidates) * SCAN_RATIO < size:
+      days = dict([(row['document'], row['pub_day']) for row in self.documents(candidates, ['document', 'pub_day'])])
+      matches = [document for document, day in days.items() if (not first_day or day >= first_day) and (not last_day or day <= last_day)]
+      matches.sort(key=lambda document: (days[document], document), reverse=True)
+      return matches
+    candidates = set(candidates)
+    where, parameters = day_conditions(first_day, last_day)
+    cursor = self.db.execute('SELECT document FROM documents%s ORDER BY pub_day DESC, document DESC' % where, parameters)
+    return [document for (document,) in cursor if document in candidates]
+
+  """The photos matching all the words, phrases and author words, published
+  between first_day and last_day (inclusive), newest first. Returns the
+  number of matches and the first limit of them.
+  """
+  def search(self, words=[], phrases=[], author=None, first_day=None, last_day=None, limit=None):
+    terms = list(words)
+    for phrase in phrases:
+      terms.extend(phrase)
+    terms.extend([AUTHOR_PREFIX + token for token in tokenize(author)])
+    if not terms:
+      #only dates, the pub_day index answers it
+      where, parameters = day_conditions(first_day, last_day)
+      total = self.db.execute('SELECT COUNT(*) FROM documents%s' % where, parameters).fetchone()[0]
+      order = ' ORDER BY pub_day DESC, document DESC%s' % (' LIMIT %d' % limit if limit else '')
+      rows = self.db.execute('SELECT %s FROM documents%s%s' % (', '.join(photo_db.CRAWL_KEYS), where, order), parameters).fetchall()
+      return total, [dict(zip(photo_db.CRAWL_KEYS, values)) for values in rows]
+    candidates = intersect([self.postings(term) for term in set(terms)])
+    matches = self.ordered(candidates, first_day, last_day)
+    if phrases:
+      #sqlite checks the phrases, so the words of the candidates are never copied
+      condition = " AND words LIKE ? ESCAPE '\\'" * len(phrases)
+      patterns = ['%%%s%%' % re.sub(r'([\\%_])', r'\\\1', joined(phrase)) for phrase in phrases]
+      found = set([row['document'] for row in self.documents(matches, ['document'], condition, patterns)])
+      matches = [match for match in matches if match in found]
+    total = len(matches)
+    if limit:
+      matches = matches[:limit]
+    order = dict([(match, i) for i, match in enumerate(matches)])
+    rows = self.documents(matches, ['document'] + photo_db.CRAWL_KEYS)
+    rows.sort(key=lambda row: order[row['document']])
+    for row in rows:
+      del row['document']
+    return total, rows
+
+  """Rewrite the postings without the documents of replaced rows.
+  """
+  def compact(self):
+    live = set([document for (document,) in self.db.execute('SELECT document FROM documents')])
+    removed = 0
+    try:
+      for term, data in self.db.execute('SELECT term, postings FROM terms').fetchall():
+        documents = unpacked_array('I', str(data))
+        kept = [document for document in documents if document in live]
+        removed = removed + len(documents) - len(kept)
+        if not kept:
+          self.db.execute('DELETE FROM terms WHERE term = ?', (term,))
+        elif len(kept) < len(documents):
+          self.db.execute('UPDATE terms SET postings = ? WHERE term = ?', (buffer(packed_array('I', kept)), term))
+      self.db.commit()
+    except:
+      self.db.rollback()
+      raise
+    self.db.execute('VACUUM')
+    return removed
+
+  def close(self):
+    self.db.commit()
+    self.db.close()
+
+def main():
+  global verbose
+  index_file_name = None
+  input_file_names = []
+  compact = None
+  author = None
+  first_day = None
+  last_day = None
+  limit = None
+  output_file = sys.stdout
+  results_format = 'csv'
+  try:
+    opts, args = getopt.getopt(sys.argv[1:], "hd:a:l:o:f:v", ["help", "index=", "add=", "compact", "author=", "from=", "to=", "limit=", "output-file=", "format=", "verbose"])
+  except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+  for o, a in opts:
+    if o in ("-h", "--help"):
+      usage()
+      sys.exit()
+    elif o in ("-d", "--index"):
+      index_file_name = a
+    elif o == "--add":
+      input_file_names.append(a)
+    elif o == "--compact":
+      compact = True
+    elif o in ("-a", "--author"):
+      author = a
+    elif o == "--from":
+      first_day = a
+    elif o == "--to":
+      last_day = a
+    elif o in ("-l", "--limit"):
+      limit = int(a)
+    elif o in ("-o", "--output-file"):
+      output_file = file(a, "wb")
+    elif o in ("-f", "--format"):
+      results_format = a
+    elif o in ("-v", "--verbose"):
+      verbose = True
+    else:
+      assert False, "unhandled option"
+  if not index_file_name:
+    return usage()
+  if results_format not in output_writers.FORMATS:
+    print "Unknown output format: %s" % results_format
+    usage()
+    sys.exit(2)
+  index = TextIndex(index_file_name)
+  if input_file_names or compact:
+    for input_file_name in input_file_names:
+      input_file = sys.stdin if input_file_name == '-' else open(input_file_name, 'rb')
+      started = time.time()
+      counts = index.add_rows(csv.DictReader(input_file))
+      log('%s: %s rows indexed in %.1fs.' % (input_file_name, counts['new'] + counts['updated'], time.time() - started))
+      if input_file is not sys.stdin: input_file.close()
+    if compact:
+      log('%s stale entries removed.' % index.compact())
+    index.close()
+    return
+  words, phrases = parse_query(' '.join(args))
+  started = time.time()
+  total, rows = index.search(words, phrases, author, first_day, last_day, limit)
+  log('%s photos found in %.1fms.' % (total, (time.time() - started) * 1000))
+  index.close()
+  writer = output_writers.open_writer(results_format, output_file, photo_db.CRAWL_KEYS)
+  writer.write_rows(rows)
+  writer.close()
+  output_file.close()
+
+def log(m):
+  global verbose
+  if verbose: print >> sys.stderr, m
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+# WorkerPool: Small threading helpers shared by the ABrCrawl scripts to run
+# network bound tasks concurrently while keeping results in input order.
+#
+# http://github.com/fczuardi/abrcrawl
+#
+# Copyright (c) 2009, Fabricio Zuardi
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer in
+#     the documentation and/or other materials provided with the
+#     distribution.
+#   * Neither the name of the author nor the names of its contributors
+#     may be used to endorse or promote products derived from this
+#     software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+__author__ = ('Fabricio Zuardi', 'fabricio@fabricio.org', 'http://fabricio.org')
+__license__ = "BSD"
+
+import sys
+import time
+import threading
+import Queue
+import urlparse
+
+"""Space the requests sent to the same host so that no more than `rate`
+requests per second are started. A rate of 0 disables the limit.
+"""
+class RateLimiter(object):
+  def __init__(self, rate):
+    self.interval = 1.0 / rate if rate else 0
+    self.lock = threading.Lock()
+    self.next_slot = {}
+
+  def wait(self, url):
+    if not self.interval: return
+    host = urlparse.urlsplit(url)[1]
+    self.lock.acquire()
+    try:
+      now = time.time()
+      slot = max(now, self.next_slot.get(host, now))
+      self.next_slot[host] = slot + self.interval
+    finally:
+      self.lock.release()
+    if slot > now:
+      time.sleep(slot - now)
+
+"""Limit the number of simultaneous requests sent to the same host, adapting
+the limit to how the host copes (additive increase, multiplicative decrease):
+each successful request raises the limit by 1/limit, so it grows by about one
+per round of requests, up to max_limit. An overloaded answer halves it, at
+most once per round: requests started before the last decrease do not
+decrease it again. pause() holds all new requests to a host for a while.
+"""
+class AdaptiveLimiter(object):
+  def __init__(self, max_limit, min_limit=1):
+    self.max_limit = max_limit
+    self.min_limit = min(min_limit, max_limit)
+    self.condition = threading.Condition()
+    self.hosts = {}
+
+  def host(self, url):
+    host = urlparse.urlsplit(url)[1]
+    if host not in self.hosts:
+      self.hosts[host] = {'limit': float(self.min_limit), 'active': 0, 'paused_until': 0, 'decreased_at': 0}
+    return self.hosts[host]
+
+  def limit(self, url):
+    self.condition.acquire()
+    try:
+      return int(self.host(url)['limit'])
+    finally:
+      self.condition.release()
+
+  def acquire(self, url):
+    self.condition.acquire()
+    try:
+      state = self.host(url)
+      while True:
+        wait = state['paused_until'] - time.time()
+        if wait > 0:
+          self.condition.wait(wait)
+        elif state['active'] < int(state['limit']):
+          state['active'] = state['active'] + 1
+          return
+        else:
+          self.condition.wait()
+    finally:
+      self.condition.release()
+
+  """Give back the slot of a request started at `started`, telling whether the
+  host answered normally or showed signs of overload.
+  """
+  def release(self, url, healthy=True, started=None):
+    self.condition.acquire()
+    try:
+      state = self.host(url)
+      state['active'] = state['active'] - 1
+      if healthy:
+        state['limit'] = min(self.max_limit, state['limit'] + 1.0 / state['limit'])
+      elif started is None or started >= state['decreased_at']:
+        state['limit'] = max(self.min_limit, state['limit'] / 2)
+        state['decreased_at'] = time.time()
+      self.condition.notifyAll()
+    finally:
+      self.condition.release()
+
+  def pause(self, url, seconds):
+    self.condition.acquire()
+    try:
+      state = self.host(url)
+      state['paused_until'] = max(state['paused_until'], time.time() + seconds)
+    finally:
+      self.condition.release()
+
+"""Call func(item) for every item using up to `workers` threads and yield the
+results in the same order as the input. At most `workers * 2` results are kept
+waiting in memory, so it is safe to use with very long (or lazy) inputs.
+Exceptions raised by func are re-raised in the consumer thread.
+"""
+def ordered_map(func, items, workers=1):
+  if workers <= 1:
+    for item in items:
+      yield func(item)
+    return
+  window = threading.Semaphore(workers * 2)
+  tasks = Queue.Queue()
+  results = {}
+  done = threading.Condition()
+  state = {'total': None, 'stop': False, 'error': None}
+
+  def feed():
+    count = 0
+    try:
+      try:
+        for item in items:
+          window.acquire()
+          if state['stop']: break
+          tasks.put((count, item))
+          count = count + 1
+      except Exception:
+        state['error'] = sys.exc_info()
+    finally:
+      done.acquire()
+      state['total'] = count
+      done.notifyAll()
+      done.release()
+      for i in range(workers):
+        tasks.put(None)
+
+  def work():
+    while True:
+      task = tasks.get()
+      if task is None: break
+      index, item = task
+      if state['stop']:
+        result = (False, None)
+      else:
+        try:
+          result = (True, func(item))
+        except Exception:
+          result = (False, sys.exc_info())
+      done.acquire()
+      results[index] = result
+      done.notifyAll()
+      done.release()
+
+  threads = [threading.Thread(target=feed)]
+  threads.extend([threading.Thread(target=work) for i in range(workers)])
+  for thread in threads:
+    thread.setDaemon(True)
+    thread.start()
+  index = 0
+  try:
+    while True:
+      done.acquire()
+      try:
+        while index not in results and state['total'] != index:
+          done.wait(1)
+        if index not in results:
+          if state['error']:
+            error = state['error']
+            raise error[0], error[1], error[2]
+          break
+        ok, value = results.pop(index)
+      finally:
+        done.release()
+      window.release()
+      if not ok:
+        raise value[0], value[1], value[2]
+      yield value
+      index = index + 1
+  finally:
+    #the consumer stopped early (or failed), let the threads wind down
+    state['stop'] = True
+    window.release()
+    for thread in threads:
+      thread.join()
+
+"""Iterate over items in a background thread, keeping up to `size` of them
+ready in a queue, so that a slow consumer and a slow producer work at the
+same time. Exceptions raised by the producer are re-raised in the consumer.
+"""
+def buffered(items, size):
+  queue = Queue.Queue(size)
+  state = {'stop': False}
+
+  def put(entry):
+    #give up on a consumer that stopped reading
+    while not state['stop']:
+      try:
+        queue.put(entry, True, 0.1)
+        return True
+      except Queue.Full:
+        pass
+    return False
+
+  def produce():
+    try:
+      for item in items:
+        if not put((True, item)): return
+    except Exception:
+      put((False, sys.exc_info()))
+      return
+    put(None)
+
+  thread = threading.Thread(target=produce)
+  thread.setDaemon(True)
+  thread.start()
+  try:
+    while True:
+      entry = queue.get()
+      if entry is None: break
+      ok, value = entry
+      if not ok:
+        raise value[0], value[1], value[2]
+      yield value
+  finally:
+    state['stop'] = True
+    thread.join()